@@ -0,0 +1,164 @@
+"""
+amenities.py
+------------
+Proximity-to-care / food layers for the Sanctuary Map.
+
+Extracts hospitals, clinics, dialysis centres and supermarkets from the same PBF
+`points` and `multipolygons` layers as the hazards, stores them as compact
+(n, 2) coordinate arrays in UTM 11N (amenities.npz), and answers nearest-distance
+questions with one KD-tree per category — vectorized, so millions of grid cells
+or addresses take seconds.
+
+"Must be within X km of care" becomes an INCLUSION layer: the safe zone is the
+study area inside every inclusion layer, minus every exclusion zone.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+
+from sanctuary_map import CRS_METRIC, CRS_WGS84, filter_tags, read_pbf_layer
+
+
+# ---------------------------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------------------------
+
+# category → [(OSM key, value), ...]  — any match counts
+AMENITY_TAGS = {
+    "hospital": [("amenity", "hospital")],
+    "clinic":   [("amenity", "clinic")],
+    "dialysis": [("amenity", "dialysis"), ("healthcare", "dialysis")],
+    "grocery":  [("shop", "supermarket")],
+}
+
+
+# ---------------------------------------------------------------------------
+# EXTRACT / STORE
+# ---------------------------------------------------------------------------
+
+def amenity_bbox(bbox: dict, reach_m: float) -> dict:
+    """The bbox grown by reach_m — a site just outside still serves the cells along its edge."""
+    if not reach_m:
+        return bbox
+    from zone_tiles import expand_bounds
+
+    west, south, east, north = expand_bounds(bbox["west"], bbox["south"], bbox["east"], bbox["north"], reach_m)
+    return {"south": south, "north": north, "west": west, "east": east}
+
+
+def extract_amenities(pbf_path: Path, bbox: dict, reach_m: float = 0.0) -> dict[str, np.ndarray]:
+    """Amenity locations within reach_m of the bbox → {category: (n, 2) metric x/y array}."""
+    print("\n  Extracting amenities from PBF...")
+    bbox = amenity_bbox(bbox, reach_m)
+
+    layers = [read_pbf_layer(pbf_path, name, bbox) for name in ("points", "multipolygons")]
+
+    amenities = select_amenities(layers)
+    for category, xy in amenities.items():
+        print(f"    {category:<10} {len(xy):>6} locations")
+    return amenities
+
+
+def select_amenities(layers: list) -> dict[str, np.ndarray]:
+    """{category: (n, 2) metric x/y} from raw PBF `points` / `multipolygons` frames."""
+    amenities = {}
+    for category, tags in AMENITY_TAGS.items():
+        coords = []
+        for gdf in layers:
+            if gdf.empty:
+                continue
+            hit = np.zeros(len(gdf), dtype=bool)
+            for key, value in tags:
+                hit |= gdf.index.isin(filter_tags(gdf, key, [value]).index)
+            if not hit.any():
+                continue
+            # Campuses come through as polygons — a point inside stands in for them
+            pts = gdf[hit].to_crs(CRS_METRIC).geometry.representative_point()
+            coords.append(np.column_stack([pts.x.to_numpy(), pts.y.to_numpy()]))
+
+        amenities[category] = np.vstack(coords) if coords else np.empty((0, 2))
+    return amenities
+
+
+def save_amenities(amenities: dict[str, np.ndarray], path: Path, reach_m: float = 0.0) -> None:
+    """reach_m: how far past the bbox the amenities were read (see amenity_bbox)."""
+    np.savez_compressed(path, crs=np.array(CRS_METRIC), reach_m=np.array(reach_m), **amenities)
+    print(f"  Amenities saved → {path.resolve()}")
+
+
+def load_amenities(path: Path) -> dict[str, np.ndarray]:
+    with np.load(path) as data:
+        if str(data["crs"]) != CRS_METRIC:
+            raise ValueError(f"{path} is in {data['crs']}, expected {CRS_METRIC} — re-run extract")
+        return {name: data[name] for name in data.files if name not in ("crs", "reach_m")}
+
+
+def amenities_reach_m(path: Path) -> float:
+    """reach_m the file was saved with (0 for files from before it was recorded)."""
+    with np.load(path) as data:
+        return float(data["reach_m"]) if "reach_m" in data.files else 0.0
+
+
+# ---------------------------------------------------------------------------
+# NEAREST-DISTANCE INDEX
+# ---------------------------------------------------------------------------
+
+class AmenityIndex:
+    """One KD-tree per amenity category, in CRS_METRIC metres."""
+
+    def __init__(self, amenities: dict[str, np.ndarray]):
+        from scipy.spatial import cKDTree
+
+        self.trees = {cat: cKDTree(xy) for cat, xy in amenities.items() if len(xy)}
+        self.categories = list(amenities)
+        self._to_metric = None
+
+    @classmethod
+    def from_file(cls, path: Path) -> AmenityIndex:
+        return cls(load_amenities(path))
+
+    def nearest(self, xy: np.ndarray, category: str) -> np.ndarray:
+        """Distance (m) from each metric x/y row to the closest `category` site (inf if none)."""
+        xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+        if category not in self.trees:
+            return np.full(len(xy), np.inf)
+        dist, _ = self.trees[category].query(xy, k=1, workers=-1)
+        return dist
+
+    def nearest_lonlat(self, lats: np.ndarray, lons: np.ndarray) -> dict[str, np.ndarray]:
+        """{category: distances in metres} for WGS84 points."""
+        if self._to_metric is None:
+            from pyproj import Transformer
+
+            self._to_metric = Transformer.from_crs(CRS_WGS84, CRS_METRIC, always_xy=True)
+        x, y = self._to_metric.transform(np.asarray(lons, float), np.asarray(lats, float))
+        xy = np.column_stack([x, y])
+        return {cat: self.nearest(xy, cat) for cat in self.categories}
+
+
+# ---------------------------------------------------------------------------
+# INCLUSION LAYERS
+# ---------------------------------------------------------------------------
+
+def build_inclusion_zones(amenities: dict[str, np.ndarray], rules: dict) -> dict:
+    """{layer: (categories, radius_m)} → {layer: GeoDataFrame of the reachable area}."""
+    import geopandas as gpd
+    import shapely
+
+    print("\n  Building inclusion zones...")
+    zones = {}
+    for layer, (categories, radius_m) in rules.items():
+        xy = np.vstack([amenities.get(cat, np.empty((0, 2))) for cat in categories])
+        label = "/".join(categories)
+        if not len(xy):
+            # Nothing reachable → nothing qualifies; keep an empty layer so it still excludes
+            print(f"    {layer:<13} no {label} found — nothing qualifies")
+            zones[layer] = gpd.GeoDataFrame(geometry=[], crs=CRS_WGS84)
+            continue
+        reach = shapely.union_all(shapely.buffer(shapely.points(xy), radius_m))
+        zones[layer] = gpd.GeoDataFrame(geometry=[reach], crs=CRS_METRIC).to_crs(CRS_WGS84)
+        print(f"    {layer:<13} within {radius_m / 1000:g} km of {label} ({len(xy)} sites)")
+    return zones
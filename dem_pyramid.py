@@ -0,0 +1,224 @@
+# /// script
+# requires-python = ">=3.10"
+# dependencies = [
+#     "numpy",
+#     "rasterio",
+#     "shapely",
+#     "dem-stitcher",
+# ]
+# ///
+
+"""
+dem_pyramid.py
+--------------
+Multi-resolution elevation pyramid for zoom-dependent flood analysis.
+
+From a DEM (usually a dem_store.py VRT) this writes, once per mosaic:
+
+  dem_cache/pyramids/<mosaic>/
+    dem_cog.tif         tiled, DEFLATE Cloud-Optimized GeoTIFF (full resolution only —
+                        readers want classes, which the band levels below carry)
+    bands_x1.tif        elevation band classes at full resolution
+    bands_x2.tif …      the same classes at 1/2, 1/4, … resolution
+    pyramid.json        factors, band thresholds, source
+
+Band classes (uint8):  0 = above every band,  1 = ≤ 30 m,  2 = ≤ 10 m,  255 = no data.
+Coarse levels are MAX-pooled, so an overview pixel is as risky as its worst
+full-resolution pixel — overviews may over-flag, never under-flag.
+
+Readers ask for a bbox at a target pixel size and get the coarsest level that
+still resolves it, so county overviews touch a few hundred KB while zoomed-in
+views fall back to full resolution.
+
+    ./uv run dem_pyramid.py build --bbox "-117.20,32.70,-117.10,32.80"
+    ./uv run dem_pyramid.py info  --bbox "-117.20,32.70,-117.10,32.80"
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from dem_store import DemStore, DemStoreError, parse_bbox
+
+# ── settings ────────────────────────────────────────────────────────────────
+
+ELEV_BANDS   = (30, 10)               # metres; class i+1 = at or below ELEV_BANDS[i]
+FACTORS      = (1, 2, 4, 8, 16, 32)   # pyramid levels (decimation factors)
+CLASS_NODATA = 255
+STRIP_ROWS   = 1024                   # rows per processing strip (multiple of max factor)
+BLOCK        = 512                    # COG / GeoTIFF internal tile size
+
+
+def pyramid_dir(dem_path: Path) -> Path:
+    """Pyramid folder for a DEM; dem_store mosaics share dem_cache/pyramids/."""
+    dem_path = Path(dem_path)
+    if dem_path.parent.name == "mosaics":
+        return dem_path.parent.parent / "pyramids" / dem_path.stem
+    return dem_path.parent / f"{dem_path.stem}_pyramid"
+
+
+def classify(elev: np.ndarray, nodata_mask: np.ndarray, bands: tuple = ELEV_BANDS) -> np.ndarray:
+    """Elevation → band class (0 safe, 1..n lower bands, CLASS_NODATA)."""
+    cls = np.zeros(elev.shape, dtype=np.uint8)
+    for i, limit in enumerate(bands, start=1):
+        cls[elev <= limit] = i
+    cls[nodata_mask] = CLASS_NODATA
+    return cls
+
+
+def block_max(cls: np.ndarray, factor: int) -> np.ndarray:
+    """MAX-pool a class array by `factor`, ignoring no-data unless a block is all no-data."""
+    if factor == 1:
+        return cls
+    h, w = cls.shape
+    H, W = -(-h // factor), -(-w // factor)
+    padded = np.full((H * factor, W * factor), CLASS_NODATA, dtype=np.uint8)
+    padded[:h, :w] = cls
+
+    blocks = padded.reshape(H, factor, W, factor)
+    valid  = blocks != CLASS_NODATA
+    pooled = np.where(valid, blocks, 0).max(axis=(1, 3)).astype(np.uint8)
+    pooled[~valid.any(axis=(1, 3))] = CLASS_NODATA
+    return pooled
+
+
+# ── build ───────────────────────────────────────────────────────────────────
+
+def build_pyramid(dem_path: Path, force: bool = False) -> Path:
+    """Write the COG + per-level band rasters for dem_path (skipped if already built)."""
+    import rasterio
+    import rasterio.shutil
+    from affine import Affine
+    from rasterio.windows import Window
+
+    out  = pyramid_dir(dem_path)
+    meta = out / "pyramid.json"
+    if meta.exists() and not force:
+        print(f"  Using cached elevation pyramid: {out}")
+        return out
+    out.mkdir(parents=True, exist_ok=True)
+
+    # 1. elevation → COG (GDAL streams it); no overviews — nothing reads averaged elevation
+    cog = out / "dem_cog.tif"
+    print("  Writing DEM Cloud-Optimized GeoTIFF...")
+    rasterio.shutil.copy(
+        dem_path, cog, driver="COG",
+        COMPRESS="DEFLATE", PREDICTOR="YES", BLOCKSIZE=BLOCK, OVERVIEWS="NONE",
+    )
+
+    # 2. band classes at every level, strip by strip
+    print(f"  Writing band-class rasters for factors {FACTORS}...")
+    with rasterio.open(cog) as src:
+        base = dict(
+            driver="GTiff", dtype="uint8", count=1, crs=src.crs, nodata=CLASS_NODATA,
+            tiled=True, blockxsize=BLOCK, blockysize=BLOCK, compress="deflate",
+        )
+        sinks = {}
+        try:
+            for f in FACTORS:
+                sinks[f] = rasterio.open(
+                    out / f"bands_x{f}.tif", "w",
+                    width=-(-src.width // f), height=-(-src.height // f),
+                    transform=src.transform * Affine.scale(f), **base,
+                )
+
+            for row in range(0, src.height, STRIP_ROWS):
+                rows  = min(STRIP_ROWS, src.height - row)
+                strip = src.read(1, window=Window(0, row, src.width, rows), masked=True)
+                cls   = classify(strip.astype("float32").filled(np.nan), np.ma.getmaskarray(strip))
+                for f, sink in sinks.items():
+                    pooled = block_max(cls, f)
+                    sink.write(pooled, 1, window=Window(0, row // f, pooled.shape[1], pooled.shape[0]))
+        finally:
+            for sink in sinks.values():
+                sink.close()
+
+    meta.write_text(json.dumps({
+        "source":   str(Path(dem_path).resolve()),
+        "factors":  list(FACTORS),
+        "bands_m":  list(ELEV_BANDS),
+        "classes":  {"0": "above bands", **{str(i): f"<= {b} m" for i, b in enumerate(ELEV_BANDS, 1)}},
+    }, indent=2))
+    print(f"  Elevation pyramid → {out}")
+    return out
+
+
+def write_class_levels(cls: np.ndarray, transform, crs, out: Path, prefix: str) -> None:
+    """Write an in-memory class array as <prefix>_x{f}.tif for every pyramid factor."""
+    import rasterio
+    from affine import Affine
+
+    for f in FACTORS:
+        pooled = block_max(cls, f)
+        with rasterio.open(
+            out / f"{prefix}_x{f}.tif", "w",
+            driver="GTiff", dtype="uint8", count=1, crs=crs, nodata=CLASS_NODATA,
+            width=pooled.shape[1], height=pooled.shape[0], transform=transform * Affine.scale(f),
+            tiled=True, blockxsize=BLOCK, blockysize=BLOCK, compress="deflate",
+        ) as sink:
+            sink.write(pooled, 1)
+
+
+# ── read ────────────────────────────────────────────────────────────────────
+
+def pick_factor(pixel_width: float, target_px: int) -> int:
+    """Coarsest factor that still gives at least target_px across the bbox."""
+    for f in sorted(FACTORS, reverse=True):
+        if pixel_width / f >= target_px:
+            return f
+    return 1
+
+
+def read_bands(pyramid: Path, bbox: tuple, target_px: int = 2048, prefix: str = "bands"):
+    """Class raster for bbox at the coarsest adequate level → (array, transform, crs, factor).
+
+    prefix "bands" = elevation bands; "hand" = hydro.py flood classes.
+    """
+    import rasterio
+    from rasterio.windows import from_bounds
+
+    with rasterio.open(pyramid / f"{prefix}_x1.tif") as full:
+        width_px = (bbox[2] - bbox[0]) / full.res[0]
+    factor = pick_factor(width_px, target_px)
+
+    with rasterio.open(pyramid / f"{prefix}_x{factor}.tif") as src:
+        window = from_bounds(*bbox, transform=src.transform).round_offsets().round_lengths()
+        data   = src.read(1, window=window, boundless=True, fill_value=CLASS_NODATA)
+        return data, src.window_transform(window), src.crs, factor
+
+
+# ── CLI ─────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="COG + band-class pyramid for a DEM bbox")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, text in (("build", "Build (or reuse) the pyramid"), ("info", "Show levels and sizes")):
+        p = sub.add_parser(name, help=text)
+        p.add_argument("--bbox", type=parse_bbox, required=True, help='"west,south,east,north"')
+        p.add_argument("--offline", action="store_true", help="Use only cached DEM tiles")
+    sub.choices["build"].add_argument("--force", action="store_true", help="Rebuild even if cached")
+    args = parser.parse_args()
+
+    try:
+        dem = DemStore().mosaic(args.bbox, offline=args.offline)
+    except DemStoreError as exc:
+        print(f"  ERROR: {exc}")
+        sys.exit(1)
+
+    if args.command == "build":
+        build_pyramid(dem, force=args.force)
+        return
+
+    out = pyramid_dir(dem)
+    if not (out / "pyramid.json").exists():
+        print("  No pyramid yet for this bbox — run `dem_pyramid.py build` first")
+        sys.exit(1)
+    for path in [out / "dem_cog.tif"] + [out / f"bands_x{f}.tif" for f in FACTORS]:
+        print(f"  {path.name:<16} {path.stat().st_size / 1024:>9.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
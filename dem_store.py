@@ -0,0 +1,394 @@
+# /// script
+# requires-python = ">=3.10"
+# dependencies = [
+#     "rasterio",
+#     "shapely",
+#     "dem-stitcher",
+# ]
+# ///
+
+"""
+dem_store.py
+------------
+Local, content-addressed DEM tile cache.
+
+Source tiles live under dem_cache/objects/<sha256[:2]>/<sha256>.tif and are
+never rewritten once stored.  Any bbox is served as a small VRT that points at
+the cached tiles (no pixel data is copied), so changing the study area only
+downloads 1°×1° cells that are not on disk yet.
+
+    dem_cache/
+      manifest.json       tile + mosaic provenance
+      objects/ab/ab12….tif
+      mosaics/<key>.vrt   one per (bbox, tile set)
+
+    ./uv run dem_store.py seed ~/Downloads/n32_w117_1arc_v3.tif --source usgs-srtm
+    ./uv run dem_store.py mosaic --bbox "-117.20,32.70,-117.10,32.80"
+    ./uv run dem_store.py mosaic --bbox "-117.20,32.70,-117.10,32.80" --offline
+    ./uv run dem_store.py list
+
+Bboxes here are (west, south, east, north) tuples, like BBOX in the flood scripts.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+# ── settings ────────────────────────────────────────────────────────────────
+
+DEM_CACHE_DIR = Path("dem_cache")
+DEM_NAME      = "srtm_v3"        # dem-stitcher product for new cells
+CELL_DEG      = 1.0              # fetch granularity (SRTM tiles are 1°×1°)
+GRID_TOL_PX   = 0.01             # max tile-origin offset from the mosaic grid, in pixels
+HASH_CHUNK    = 1 << 20
+
+
+class DemStoreError(Exception):
+    pass
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cell_key(west: int, south: int) -> str:
+    """SRTM-style name of the 1° cell whose lower-left corner is (west, south)."""
+    ns = "N" if south >= 0 else "S"
+    ew = "E" if west  >= 0 else "W"
+    return f"{ns}{abs(south):02d}{ew}{abs(west):03d}"
+
+
+def cells_for_bbox(bbox: tuple) -> list[tuple[int, int]]:
+    """Lower-left corners of every 1° cell touching bbox (west, south, east, north)."""
+    west, south, east, north = bbox
+    xs = range(math.floor(west / CELL_DEG), math.ceil(east / CELL_DEG))
+    ys = range(math.floor(south / CELL_DEG), math.ceil(north / CELL_DEG))
+    return [(int(x * CELL_DEG), int(y * CELL_DEG)) for y in ys for x in xs]
+
+
+# ── store ───────────────────────────────────────────────────────────────────
+
+class DemStore:
+    """Content-addressed DEM tiles + VRT mosaics for arbitrary bboxes."""
+
+    def __init__(self, root: Path = DEM_CACHE_DIR):
+        self.root     = Path(root)
+        self.objects  = self.root / "objects"
+        self.mosaics  = self.root / "mosaics"
+        self.manifest_path = self.root / "manifest.json"
+        self.manifest = self._load_manifest()
+
+    # -- manifest -----------------------------------------------------------
+
+    def _load_manifest(self) -> dict:
+        if self.manifest_path.exists():
+            return json.loads(self.manifest_path.read_text())
+        return {"tiles": {}, "cells": {}, "mosaics": {}}
+
+    def _save_manifest(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifest_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(self.manifest, indent=2, sort_keys=True))
+        tmp.replace(self.manifest_path)
+
+    def object_path(self, sha: str) -> Path:
+        return self.objects / sha[:2] / f"{sha}.tif"
+
+    # -- adding tiles -------------------------------------------------------
+
+    def add_file(self, path: Path, source: str, origin: str | None = None, cell: str | None = None) -> str:
+        """Store a GeoTIFF by content hash (no-op if already stored); return its sha256."""
+        import rasterio
+
+        path = Path(path)
+        sha  = file_sha256(path)
+        dest = self.object_path(sha)
+
+        if sha not in self.manifest["tiles"] or not dest.exists():
+            with rasterio.open(path) as src:
+                if src.count < 1 or src.crs is None:
+                    raise DemStoreError(f"{path} is not a georeferenced single-band DEM")
+                if not src.crs.is_geographic:
+                    raise DemStoreError(f"{path} is projected — store lon/lat tiles (like SRTM)")
+                info = {
+                    "bounds": list(src.bounds),
+                    "crs":    src.crs.to_string(),
+                    "res":    list(src.res),
+                    "dtype":  src.dtypes[0],
+                    "nodata": src.nodata,
+                    "size":   [src.width, src.height],
+                }
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            if not dest.exists():
+                shutil.copyfile(path, dest)
+            info.update(
+                source=source,
+                origin=origin or str(path.resolve()),
+                added=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                bytes=dest.stat().st_size,
+            )
+            self.manifest["tiles"][sha] = info
+
+        if cell:
+            self.manifest["cells"][f"{source}/{cell}"] = sha
+        self._save_manifest()
+        return sha
+
+    def fetch_cell(self, west: int, south: int, dem_name: str = DEM_NAME) -> str:
+        """Download one 1° cell with dem-stitcher and store it."""
+        import rasterio
+        from dem_stitcher import stitch_dem
+
+        key = cell_key(west, south)
+        print(f"  Fetching {dem_name} cell {key} via dem-stitcher...")
+        X, profile = stitch_dem(
+            [west, south, west + CELL_DEG, south + CELL_DEG],
+            dem_name=dem_name,
+            dst_ellipsoidal_height=False,
+            dst_area_or_point="Area",
+        )
+        profile.update(driver="GTiff", tiled=True, blockxsize=256, blockysize=256, compress="deflate")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp_tif = Path(tmp) / f"{key}.tif"
+            with rasterio.open(tmp_tif, "w", **profile) as ds:
+                ds.write(X, 1)
+            return self.add_file(tmp_tif, source=dem_name, origin=f"dem-stitcher:{dem_name}", cell=key)
+
+    # -- coverage -----------------------------------------------------------
+
+    def tiles_for_bbox(self, bbox: tuple) -> list[str]:
+        from shapely.geometry import box
+
+        window = box(*bbox)
+        return sorted(
+            sha for sha, info in self.manifest["tiles"].items()
+            if box(*info["bounds"]).intersects(window) and self.object_path(sha).exists()
+        )
+
+    def missing_cells(self, bbox: tuple, dem_name: str = DEM_NAME) -> list[tuple[int, int]]:
+        """1° cells touching bbox that no cached tile (fetched or seeded) covers."""
+        from shapely.geometry import box
+        from shapely.ops import unary_union
+
+        tiles   = self.tiles_for_bbox(bbox)
+        covered = unary_union([box(*self.manifest["tiles"][sha]["bounds"]) for sha in tiles])
+        # Shrink each needed area by a couple of pixels so half-pixel registration
+        # differences between products don't force a refetch.
+        tol = 2 * max((self.manifest["tiles"][sha]["res"][0] for sha in tiles), default=0)
+
+        missing = []
+        for west, south in cells_for_bbox(bbox):
+            sha = self.manifest["cells"].get(f"{dem_name}/{cell_key(west, south)}")
+            if sha and self.object_path(sha).exists():
+                continue
+            # Only the part of the cell inside bbox matters.
+            need   = box(west, south, west + CELL_DEG, south + CELL_DEG).intersection(box(*bbox))
+            shrunk = need.buffer(-tol) if tol else need
+            need   = need.centroid if shrunk.is_empty else shrunk   # bbox smaller than 2 px
+            if covered.is_empty or not covered.contains(need):
+                missing.append((west, south))
+        return missing
+
+    def ensure(self, bbox: tuple, offline: bool = False, dem_name: str = DEM_NAME) -> list[str]:
+        """Make sure bbox is covered on disk; return the covering tile hashes."""
+        missing = self.missing_cells(bbox, dem_name)
+        if missing and offline:
+            names = ", ".join(cell_key(*c) for c in missing)
+            raise DemStoreError(f"offline and no cached DEM for cells: {names} — seed them first")
+        for west, south in missing:
+            self.fetch_cell(west, south, dem_name)
+        return self.tiles_for_bbox(bbox)
+
+    # -- mosaics ------------------------------------------------------------
+
+    def mosaic_order(self, bbox: tuple, tiles: list[str]) -> list[str]:
+        """Tiles to mosaic, lowest priority first (in a VRT the last source wins).
+
+        Seeded tiles beat fetched ones, newer beats older.  The top tile sets the
+        pixel grid; tiles in another CRS / resolution, or whose origin is off that
+        grid (e.g. half-pixel-registered USGS tiles next to dem-stitcher "Area"
+        tiles), are left out rather than silently resampled or shifted — and if
+        the rest no longer cover bbox, that's an error.
+        """
+        from shapely.geometry import box
+        from shapely.ops import unary_union
+
+        infos = self.manifest["tiles"]
+
+        def priority(sha):
+            info = infos[sha]
+            return (not info["origin"].startswith("dem-stitcher:"), info["added"], sha)
+
+        ordered = sorted(tiles, key=priority)
+        ref = infos[ordered[-1]]
+        res_x, res_y = ref["res"]
+        grid_x, grid_y = ref["bounds"][0], ref["bounds"][3]
+
+        def off_grid(info):
+            if info["crs"] != ref["crs"] or not all(
+                math.isclose(a, b, rel_tol=1e-6) for a, b in zip(info["res"], ref["res"])
+            ):
+                return True
+            dx = (info["bounds"][0] - grid_x) / res_x
+            dy = (grid_y - info["bounds"][3]) / res_y
+            return max(abs(dx - round(dx)), abs(dy - round(dy))) > GRID_TOL_PX
+
+        rejected = [sha for sha in ordered if off_grid(infos[sha])]
+        for sha in rejected:
+            print(f"  WARNING: skipping DEM tile {sha[:12]} ({infos[sha]['source']}) — "
+                  f"not on the pixel grid of {ref['source']}")
+        kept = [sha for sha in ordered if sha not in rejected]
+
+        covered = unary_union([box(*infos[sha]["bounds"]) for sha in kept])
+        need    = box(*bbox).buffer(-2 * res_x)
+        if rejected and not need.is_empty and not covered.contains(need):
+            raise DemStoreError(
+                "cached tiles for this bbox sit on different pixel grids — "
+                "seed tiles from one product (or remove the mismatched ones)"
+            )
+        return kept
+
+    def mosaic(self, bbox: tuple, offline: bool = False, dem_name: str = DEM_NAME) -> Path:
+        """VRT covering bbox, built from cached tiles (reused if it already exists)."""
+        tiles = self.ensure(bbox, offline=offline, dem_name=dem_name)
+        if not tiles:
+            raise DemStoreError(f"no DEM tiles cover {bbox}")
+        tiles = self.mosaic_order(bbox, tiles)
+
+        key = hashlib.sha256(json.dumps([list(bbox), tiles]).encode()).hexdigest()[:16]
+        vrt = self.mosaics / f"{key}.vrt"
+        if vrt.exists():
+            print(f"  Using cached DEM mosaic: {vrt}")
+            return vrt
+
+        self.mosaics.mkdir(parents=True, exist_ok=True)
+        vrt.write_text(self._vrt_xml(bbox, tiles, vrt.parent))
+        self.manifest["mosaics"][key] = {
+            "bbox":    list(bbox),
+            "tiles":   tiles,
+            "sources": sorted({self.manifest["tiles"][sha]["source"] for sha in tiles}),
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        self._save_manifest()
+        print(f"  DEM mosaic → {vrt}  ({len(tiles)} cached tiles, no data copied)")
+        return vrt
+
+    def _vrt_xml(self, bbox: tuple, tiles: list[str], vrt_dir: Path) -> str:
+        from rasterio.crs import CRS
+
+        infos = [self.manifest["tiles"][sha] for sha in tiles]
+        ref   = infos[-1]                                     # highest priority (mosaic_order)
+        for info in infos[:-1]:
+            if info["crs"] != ref["crs"] or not all(
+                math.isclose(a, b, rel_tol=1e-6) for a, b in zip(info["res"], ref["res"])
+            ):
+                raise DemStoreError("cached tiles for this bbox mix CRS / resolution — cannot mosaic")
+
+        res_x, res_y = ref["res"]
+        grid_x, grid_y = ref["bounds"][0], ref["bounds"][3]   # every tile is on this grid (mosaic_order)
+        west, south, east, north = bbox
+
+        x0 = grid_x + math.floor((west  - grid_x) / res_x) * res_x
+        y0 = grid_y + math.ceil((north - grid_y) / res_y) * res_y
+        width  = math.ceil((east  - x0) / res_x)
+        height = math.ceil((y0 - south) / res_y)
+        x1, y1 = x0 + width * res_x, y0 - height * res_y
+
+        nodata = ref["nodata"]
+        dtype  = {"float32": "Float32", "float64": "Float64", "int16": "Int16",
+                  "int32": "Int32", "uint16": "UInt16", "uint8": "Byte"}[ref["dtype"]]
+
+        sources = []
+        for sha, info in zip(tiles, infos):
+            tw, ts, te, tn = info["bounds"]
+            iw, ie = max(tw, x0), min(te, x1)
+            i_s, i_n = max(ts, y1), min(tn, y0)
+            if iw >= ie or i_s >= i_n:
+                continue
+            src_x = round((iw - tw) / res_x)
+            src_y = round((tn - i_n) / res_y)
+            dst_x = round((iw - x0) / res_x)
+            dst_y = round((y0 - i_n) / res_y)
+            n_x   = round((ie - iw) / res_x)
+            n_y   = round((i_n - i_s) / res_y)
+            rel   = Path("..") / self.object_path(sha).relative_to(self.root)
+            nd    = f"\n      <NODATA>{info['nodata']}</NODATA>" if info["nodata"] is not None else ""
+            sources.append(
+                f"""    <ComplexSource>
+      <SourceFilename relativeToVRT="1">{escape(rel.as_posix())}</SourceFilename>
+      <SourceBand>1</SourceBand>
+      <SrcRect xOff="{src_x}" yOff="{src_y}" xSize="{n_x}" ySize="{n_y}" />
+      <DstRect xOff="{dst_x}" yOff="{dst_y}" xSize="{n_x}" ySize="{n_y}" />{nd}
+    </ComplexSource>"""
+            )
+
+        nd_band = f"\n    <NoDataValue>{nodata}</NoDataValue>" if nodata is not None else ""
+        return (
+            f'<VRTDataset rasterXSize="{width}" rasterYSize="{height}">\n'
+            f"  <SRS>{escape(CRS.from_string(ref['crs']).to_wkt())}</SRS>\n"
+            f"  <GeoTransform>{x0!r}, {res_x!r}, 0.0, {y0!r}, 0.0, {-res_y!r}</GeoTransform>\n"
+            f'  <VRTRasterBand dataType="{dtype}" band="1">{nd_band}\n'
+            + "\n".join(sources)
+            + "\n  </VRTRasterBand>\n</VRTDataset>\n"
+        )
+
+
+# ── CLI ─────────────────────────────────────────────────────────────────────
+
+def parse_bbox(text: str) -> tuple:
+    try:
+        west, south, east, north = [float(v.strip()) for v in text.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("bbox must be 'west,south,east,north'")
+    return west, south, east, north
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Content-addressed DEM tile cache")
+    parser.add_argument("--root", type=Path, default=DEM_CACHE_DIR, help="Cache directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("seed", help="Add local GeoTIFF tiles (works offline)")
+    p.add_argument("files", nargs="+", type=Path)
+    p.add_argument("--source", default="local", help="Provenance label, e.g. usgs-srtm")
+
+    p = sub.add_parser("mosaic", help="Build (or reuse) a VRT for a bbox")
+    p.add_argument("--bbox", type=parse_bbox, required=True, help='"west,south,east,north"')
+    p.add_argument("--offline", action="store_true", help="Never download; fail if cells are missing")
+    p.add_argument("--dem", default=DEM_NAME, help=f"dem-stitcher product (default: {DEM_NAME})")
+
+    sub.add_parser("list", help="Show cached tiles and their provenance")
+
+    args  = parser.parse_args()
+    store = DemStore(args.root)
+
+    try:
+        if args.command == "seed":
+            for path in args.files:
+                sha = store.add_file(path, source=args.source)
+                print(f"  {path}  →  {sha[:12]}")
+        elif args.command == "mosaic":
+            print(store.mosaic(args.bbox, offline=args.offline, dem_name=args.dem))
+        else:
+            for sha, info in sorted(store.manifest["tiles"].items(), key=lambda kv: kv[1]["bounds"]):
+                bounds = ", ".join(f"{v:.3f}" for v in info["bounds"])
+                print(f"  {sha[:12]}  [{bounds}]  {info['source']:<10} {info['origin']}")
+    except DemStoreError as exc:
+        print(f"  ERROR: {exc}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
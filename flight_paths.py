@@ -0,0 +1,100 @@
+"""
+flight_paths.py
+---------------
+Approach / departure corridors swept from runway geometry.
+
+A flat circle around an aerodrome misses the long, narrow strip under the
+final approach and over-flags land beside the runway.  Here every OSM
+`aeroway=runway` line becomes:
+
+  - a rectangle along the runway itself (inner half-width), and
+  - at each threshold, a trapezoid extending outward along the runway bearing,
+    widening from the inner to the outer half-width over `length_m`
+    (the shape of an FAA Part 77 approach surface, scaled to health distances).
+
+Where an aerodrome has runway lines, these corridors replace its flat
+BUFFERS["airport"] circle (only a small grounds buffer is kept, see
+sanctuary_map.buffer_distances); the circle remains for aerodromes mapped
+without runways.
+
+All corridors are built at once with NumPy coordinate arithmetic and a single
+vectorized `shapely.polygons` call — no per-runway Python loop.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from sanctuary_map import CRS_METRIC, CRS_WGS84, FLIGHT_CORRIDOR
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+
+
+# ---------------------------------------------------------------------------
+# GEOMETRY
+# ---------------------------------------------------------------------------
+
+def runway_endpoints(runways: gpd.GeoDataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """(start, end) metric coordinate arrays, one row per runway line part."""
+    import shapely
+
+    parts = shapely.get_parts(runways.to_crs(CRS_METRIC).geometry.values)
+    parts = parts[shapely.get_type_id(parts) == 1]            # LineStrings only
+    start = shapely.get_coordinates(shapely.get_point(parts, 0))
+    end   = shapely.get_coordinates(shapely.get_point(parts, -1))
+    return start, end
+
+
+def corridor_polygons(
+    start: np.ndarray,
+    end:   np.ndarray,
+    length_m: float,
+    inner_half_width_m: float,
+    outer_half_width_m: float,
+) -> np.ndarray:
+    """Runway strips + both-end approach cones as an array of shapely Polygons."""
+    import shapely
+
+    vec = end - start
+    runway_len = np.hypot(vec[:, 0], vec[:, 1])
+    keep = runway_len > 0
+    start, end, vec, runway_len = start[keep], end[keep], vec[keep], runway_len[keep]
+    if not len(start):
+        return np.empty(0, dtype=object)
+
+    u = vec / runway_len[:, None]                   # unit bearing start → end
+    n = np.column_stack([-u[:, 1], u[:, 0]])        # unit normal (left of bearing)
+    w0, w1 = inner_half_width_m, outer_half_width_m
+
+    # Runway strip: start-left, end-left, end-right, start-right
+    strip = np.stack([
+        start + n * w0, end + n * w0, end - n * w0, start - n * w0, start + n * w0,
+    ], axis=1)
+
+    # Cones leave each threshold outward: beyond `end` along +u, beyond `start` along -u
+    anchor = np.vstack([end, start])
+    out    = np.vstack([u, -u])
+    normal = np.vstack([n, -n])
+    far    = anchor + out * length_m
+    cones  = np.stack([
+        anchor + normal * w0, far + normal * w1, far - normal * w1, anchor - normal * w0,
+        anchor + normal * w0,
+    ], axis=1)
+
+    return shapely.polygons(np.concatenate([strip, cones]))
+
+
+def build_flight_zone(runways: gpd.GeoDataFrame, corridor: dict = FLIGHT_CORRIDOR) -> gpd.GeoDataFrame:
+    """Dissolved flight-path exclusion zone (CRS_WGS84) for every runway line."""
+    import geopandas as gpd
+    import shapely
+
+    start, end = runway_endpoints(runways)
+    polys = corridor_polygons(start, end, **corridor)
+    if not len(polys):
+        return gpd.GeoDataFrame(geometry=[], crs=CRS_WGS84)
+    merged = shapely.union_all(polys)
+    return gpd.GeoDataFrame(geometry=[merged], crs=CRS_METRIC).to_crs(CRS_WGS84)
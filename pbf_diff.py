@@ -0,0 +1,208 @@
+"""
+pbf_diff.py
+-----------
+Change detection between OSM snapshots → incremental zone updates.
+
+Geofabrik republishes the extract daily, but only a handful of freeways,
+waterways and runways change between snapshots.  Instead of rebuilding every
+zone, this:
+
+  1. indexes each hazard feature by OSM id + geometry hash (zone_tiles.feature_index)
+  2. diffs that index against the one stored with the tile cache
+     → added / removed / changed features
+  3. grows each changed feature's bounds by how far its zone reaches
+     (buffer distance, or the flight corridor for runways) → affected tiles
+  4. rebuilds only those tiles from the new snapshot and replaces just their
+     rows in safe_zones.gpkg (zone_tiles.write_zones)
+
+Zone work and GeoPackage writes are proportional to the size of the change;
+only the PBF read is whole-extract.
+
+    ./uv run pbf_diff.py compare old.osm.pbf new.osm.pbf     # report only
+    ./uv run pbf_diff.py update  new.osm.pbf                 # patch zone_tiles/
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from sanctuary_map import (
+    FLIGHT_CORRIDOR,
+    add_inclusion_args,
+    check_pbf,
+    extract_features,
+    parse_bbox,
+)
+from zone_tiles import (
+    TILE_DEG,
+    ZONE_TILES_DIR,
+    TileCache,
+    expand_bounds,
+    feature_index,
+    influence_m,
+    tiles_for_bounds,
+    write_zones,
+)
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# ---------------------------------------------------------------------------
+# DIFF
+# ---------------------------------------------------------------------------
+
+def diff_features(old: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    """Rows of old/new feature indexes that differ, tagged added / removed / changed.
+
+    A changed feature appears twice (old and new bounds) — both footprints need
+    their tiles rebuilt.
+    """
+    import pandas as pd
+
+    keys = ["layer", "id"]
+    both = old.merge(new, on=keys, how="outer", suffixes=("_old", "_new"), indicator=True)
+
+    added   = both["_merge"] == "right_only"
+    removed = both["_merge"] == "left_only"
+    changed = (both["_merge"] == "both") & (both["hash_old"] != both["hash_new"])
+
+    bounds = ["minx", "miny", "maxx", "maxy"]
+
+    def side(mask, suffix, change):
+        rows = both.loc[mask, keys + [f"{b}{suffix}" for b in bounds]]
+        rows.columns = keys + bounds
+        return rows.assign(change=change)
+
+    return pd.concat([
+        side(added, "_new", "added"),
+        side(removed, "_old", "removed"),
+        side(changed, "_old", "changed"),
+        side(changed, "_new", "changed"),
+    ], ignore_index=True)
+
+
+def runway_aerodromes(changes: pd.DataFrame, index: pd.DataFrame) -> pd.DataFrame:
+    """Aerodromes under a changed runway's old or new footprint.
+
+    A runway appearing or vanishing flips its aerodrome between the airfield
+    buffer and the full circle (buffer_distances), though the aerodrome row
+    itself is unchanged — so its whole zone has to be rebuilt too.
+    """
+    import numpy as np
+
+    runways  = changes[changes["layer"] == "runways"]
+    airports = index[index["layer"] == "airports"]
+    if runways.empty or airports.empty:
+        return airports.iloc[0:0]
+    r = {b: runways[b].to_numpy()[:, None] for b in ("minx", "miny", "maxx", "maxy")}
+    a = {b: airports[b].to_numpy()[None, :] for b in ("minx", "miny", "maxx", "maxy")}
+    hit = ((a["minx"] <= r["maxx"]) & (a["maxx"] >= r["minx"]) &
+           (a["miny"] <= r["maxy"]) & (a["maxy"] >= r["miny"])).any(axis=0)
+    return airports[np.asarray(hit)]
+
+
+def affected_tiles(changes: pd.DataFrame, corridor: dict, tile_deg: float = TILE_DEG,
+                   index: pd.DataFrame | None = None) -> set[tuple[int, int]]:
+    """Every tile within zone reach of a changed feature (+ aerodromes of changed runways)."""
+    import pandas as pd
+
+    if index is not None:
+        changes = pd.concat([changes, runway_aerodromes(changes, index)], ignore_index=True)
+    reach = influence_m(corridor)
+    tiles = set()
+    for row in changes.itertuples(index=False):
+        bounds = expand_bounds(row.minx, row.miny, row.maxx, row.maxy, reach[row.layer])
+        tiles.update(tiles_for_bounds(*bounds, tile_deg))
+    return tiles
+
+
+def summarize(changes: pd.DataFrame) -> None:
+    if changes.empty:
+        print("\n  No hazard features changed.")
+        return
+    # changed features have two rows (old + new footprint) — count them once
+    counts = changes.drop_duplicates(["layer", "id"]).groupby(["layer", "change"]).size()
+    print("\n  Feature changes:")
+    for (layer, change), n in counts.items():
+        print(f"    {layer:<9} {change:<8} {n:>6}")
+
+
+# ---------------------------------------------------------------------------
+# COMMANDS
+# ---------------------------------------------------------------------------
+
+def cmd_compare(args) -> None:
+    bbox = parse_bbox(args.bbox)
+    for pbf in (args.old, args.new):
+        check_pbf(pbf)
+
+    old = feature_index(extract_features(args.old, bbox))
+    new = feature_index(extract_features(args.new, bbox))
+    changes = diff_features(old, new)
+    summarize(changes)
+
+    tiles = affected_tiles(changes, FLIGHT_CORRIDOR, index=new)
+    total = len(tiles_for_bounds(bbox["west"], bbox["south"], bbox["east"], bbox["north"]))
+    print(f"\n  Tiles affected: {len(tiles)} of {total}")
+
+
+def cmd_update(args) -> None:
+    cache = TileCache(args.root)
+    if cache.manifest is None:
+        print(f"  ERROR: no tile cache in {cache.root} — run `zone_tiles.py build` first")
+        raise SystemExit(1)
+    if cache.manifest.get("mode") == "statewide":
+        # update reads the whole extract into memory — exactly what statewide.py avoids
+        print(f"  ERROR: {cache.root} was built by statewide.py — re-run statewide.py on {args.new}")
+        raise SystemExit(1)
+    check_pbf(args.new)
+    t0 = time.perf_counter()
+
+    print(f"  Cached snapshot: {cache.manifest['snapshot']}")
+    features = extract_features(args.new, cache.bbox)
+    new = feature_index(features)
+    changes = diff_features(cache.read_feature_index(), new)
+    summarize(changes)
+
+    tiles = affected_tiles(changes, cache.corridor, cache.tile_deg, new) & cache.tiles()
+    print(f"\n  Rebuilding {len(tiles)} of {len(cache.manifest['tiles'])} tiles...")
+    t1 = time.perf_counter()
+    if tiles:
+        cache.rebuild(features, tiles)
+    cache.write_feature_index(new)
+    cache.refresh_amenities(args.new, args)
+    cache.manifest["snapshot"] = args.new.name
+    cache.save_manifest()
+    print(f"  Tiles patched in {time.perf_counter() - t1:.1f} s "
+          f"(total {time.perf_counter() - t0:.1f} s incl. PBF read)")
+
+    write_zones(cache, cache.inclusions(args), None if args.merge else tiles)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Diff OSM snapshots and patch the zone tile cache")
+    parser.add_argument("--root", type=Path, default=ZONE_TILES_DIR, help="Tile cache directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("compare", help="Report hazard-feature changes between two PBFs")
+    p.add_argument("old", type=Path, help="Earlier snapshot")
+    p.add_argument("new", type=Path, help="Later snapshot")
+    p.add_argument("--bbox", type=str, default=None, help='"south,north,west,east" — default is full SD County')
+    p.set_defaults(func=cmd_compare)
+
+    p = sub.add_parser("update", help="Rebuild only the tiles a new snapshot changes")
+    p.add_argument("new", type=Path, help="New snapshot")
+    p.add_argument("--merge", action="store_true", help="Rewrite all of safe_zones.gpkg, not just the rebuilt tiles")
+    add_inclusion_args(p)
+    p.set_defaults(func=cmd_update)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,395 @@
+"""
+sanctuary_map.py
+----------------
+Health-based residential exclusion mapper for San Diego, CA.
+
+Pipeline:  extract (PBF → features)  →  zones (buffers + safe area)  →  render (PNG)
+           query   (lat/lon verdicts against saved zones)
+           serve   (long-running local service, see sanctuary_server.py)
+
+Heavy libraries (geopandas, matplotlib, contextily, ...) are imported inside the
+subcommands that need them, so `--help` and `query` start fast.  Pass `--timing`
+to print import / total time for the subcommand (module-level imports are stdlib
+only; `python -X importtime` shows them).
+
+    ./uv run sanctuary_map.py                      # full pipeline (extract → zones → render)
+    ./uv run sanctuary_map.py extract --bbox "32.70,32.80,-117.20,-117.10"
+    ./uv run sanctuary_map.py zones
+    ./uv run sanctuary_map.py render
+    ./uv run sanctuary_map.py query 32.75,-117.15
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+
+
+# ---------------------------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------------------------
+
+PBF_FILE = Path("socal_latest_20260221.osm.pbf")
+
+# Full San Diego County
+DEFAULT_BBOX = {"south": 32.53, "north": 33.51, "west": -117.60, "east": -116.08}
+
+CRS_WGS84  = "EPSG:4326"
+CRS_METRIC = "EPSG:32611"   # UTM 11N — metres, San Diego
+
+BUFFERS = {
+    "freeway":  610,    # ~2,000 ft
+    "airport":  8046,   # ~5 mi — aerodromes with no runway line mapped
+    "airfield": 300,    # aerodrome grounds when runway corridors carry the distance
+    "river":    300,    # flood proxy
+}
+BUFFER_QUAD_SEGS = 16   # arc segments per quarter circle — full and tiled builds must agree
+
+# Approach / departure cones swept from each runway line (see flight_paths.py)
+FLIGHT_CORRIDOR = {
+    "length_m":           8046,   # ~5 mi beyond each threshold
+    "inner_half_width_m":  305,   # ~1,000 ft either side at the threshold
+    "outer_half_width_m": 1500,   # ~1 mi wide strip at the far end
+}
+
+FREEWAY_TAGS = ["motorway", "motorway_link", "trunk", "trunk_link"]
+RIVER_TAGS   = ["river", "stream", "canal", "drain"]
+AIRPORT_TAGS = ["aerodrome", "runway"]
+RUNWAY_TAGS  = ["runway"]
+
+# zone layer → (feature layer, BUFFERS key)
+ZONE_SOURCES = {
+    "freeway_zone": ("freeways", "freeway"),
+    "airport_zone": ("airports", "airport"),
+    "river_zone":   ("rivers",   "river"),
+}
+
+# Inclusion layers: the safe zone must lie inside each one.
+# layer → (amenity categories, default radius in metres; None = off unless asked for)
+INCLUSION_RULES = {
+    "care_zone": (("hospital", "dialysis"), 16_000),   # ~10 mi to a hospital or dialysis centre
+    "food_zone": (("grocery",),             None),     # e.g. 1,200 m ≈ 15 min walk to a supermarket
+}
+
+FEATURES_GPKG   = Path("sanctuary_features.gpkg")   # written by `extract`
+AMENITIES_NPZ   = Path("amenities.npz")             # written by `extract`
+OUTPUT_SAFE_SHP = Path("safe_zones.gpkg")           # written by `zones`
+OUTPUT_MAP_PNG  = Path("sanctuary_exclusion_map.png")
+
+STUDY_LAYER = "study_area"
+SAFE_LAYER  = "safe_zones"
+
+
+# ---------------------------------------------------------------------------
+# TIMING
+# ---------------------------------------------------------------------------
+
+TIMING   = False
+_T_START = 0.0     # set at main() entry
+
+
+@contextmanager
+def import_timer(subcommand: str):
+    """Time the lazy imports of one subcommand (printed with --timing)."""
+    t0 = time.perf_counter()
+    yield
+    if TIMING:
+        print(f"  [timing] {subcommand}: imports {time.perf_counter() - t0:.3f} s")
+
+
+def report_total(subcommand: str) -> None:
+    if TIMING:
+        print(f"  [timing] {subcommand}: total {time.perf_counter() - _T_START:.3f} s")
+
+
+# ---------------------------------------------------------------------------
+# HELPERS
+# ---------------------------------------------------------------------------
+
+def parse_bbox(text: str | None) -> dict:
+    """Parse "south,north,west,east" (or None → full SD County)."""
+    if not text:
+        print("\n  Using default bbox: full San Diego County")
+        return DEFAULT_BBOX.copy()
+    try:
+        s, n, w, e = [float(v.strip()) for v in text.split(",")]
+    except ValueError:
+        print("  ERROR: --bbox must be 'south,north,west,east'")
+        sys.exit(1)
+    print(f"\n  Custom bbox: S={s} N={n} W={w} E={e}")
+    return {"south": s, "north": n, "west": w, "east": e}
+
+
+def bbox_polygon(bbox: dict):
+    """Shapely polygon for a south/north/west/east bbox dict."""
+    from shapely.geometry import box
+
+    return box(bbox["west"], bbox["south"], bbox["east"], bbox["north"])
+
+
+def check_pbf(pbf_path: Path) -> None:
+    if not pbf_path.exists():
+        print(f"  ERROR: PBF not found at {pbf_path.resolve()}")
+        print("  Download: https://download.geofabrik.de/north-america/us/california/socal.html")
+        sys.exit(1)
+
+
+def is_hazard_layer(name: str) -> bool:
+    """True for exclusion-zone layers in the zones GeoPackage."""
+    return name != SAFE_LAYER and name not in INCLUSION_RULES
+
+
+def check_file(path: Path, producer: str) -> None:
+    if not path.exists():
+        print(f"  ERROR: {path} not found — run `sanctuary_map.py {producer}` first")
+        sys.exit(1)
+
+
+# ---------------------------------------------------------------------------
+# EXTRACT
+# ---------------------------------------------------------------------------
+
+def filter_tags(gdf: gpd.GeoDataFrame, key: str, values: list) -> gpd.GeoDataFrame:
+    """Rows whose `key` column or `other_tags` string matches one of `values`."""
+    import pandas as pd
+
+    if gdf.empty:
+        return gdf
+    mask = pd.Series(False, index=gdf.index)
+    if key in gdf.columns:
+        mask |= gdf[key].isin(values)
+    if "other_tags" in gdf.columns:
+        # PBF tags come through as '"key"=>"value","key2"=>"value2"'
+        for val in values:
+            mask |= gdf["other_tags"].str.contains(f'"{key}"=>"{val}"', na=False, regex=False)
+    return gdf[mask]
+
+
+def read_pbf_layer(pbf_path: Path, layer: str, bbox: dict) -> gpd.GeoDataFrame:
+    import geopandas as gpd
+
+    window = (bbox["west"], bbox["south"], bbox["east"], bbox["north"])
+    return gpd.read_file(pbf_path, layer=layer, bbox=window, engine="pyogrio")
+
+
+def extract_features(pbf_path: Path, bbox: dict) -> dict:
+    """Freeways, waterways and airports inside the bbox, keyed by layer name."""
+    print("\n  Extracting features from PBF...")
+
+    lines = read_pbf_layer(pbf_path, "lines", bbox)
+    polys = read_pbf_layer(pbf_path, "multipolygons", bbox)
+
+    features = select_features(lines, polys)
+    for name, gdf in features.items():
+        print(f"    {name:<10} {len(gdf):>6} features")
+    return features
+
+
+def select_features(lines: gpd.GeoDataFrame, polys: gpd.GeoDataFrame) -> dict:
+    """The hazard layers out of raw PBF `lines` / `multipolygons` rows (CRS_WGS84)."""
+    features = {
+        "freeways": filter_tags(lines, "highway",  FREEWAY_TAGS),
+        "rivers":   filter_tags(lines, "waterway", RIVER_TAGS),
+        "airports": filter_tags(polys, "aeroway",  AIRPORT_TAGS),
+        "runways":  filter_tags(lines, "aeroway",  RUNWAY_TAGS),
+    }
+    for name, gdf in features.items():
+        keep = [c for c in ("osm_id", "osm_way_id", "name") if c in gdf.columns]
+        features[name] = gdf[keep + ["geometry"]].to_crs(CRS_WGS84)
+    return features
+
+
+def save_features(features: dict, bbox: dict, path: Path) -> None:
+    import geopandas as gpd
+
+    path.unlink(missing_ok=True)   # no stale layers from an earlier bbox
+    study = gpd.GeoDataFrame({k: [v] for k, v in bbox.items()}, geometry=[bbox_polygon(bbox)], crs=CRS_WGS84)
+    study.to_file(path, layer=STUDY_LAYER, driver="GPKG")
+    for name, gdf in features.items():
+        if not gdf.empty:
+            gdf.to_file(path, layer=name, driver="GPKG")
+    print(f"  Features saved → {path.resolve()}")
+
+
+def load_features(path: Path) -> tuple[dict, dict]:
+    """Read back (bbox, features) written by save_features()."""
+    import geopandas as gpd
+    import pyogrio
+
+    layers = {name for name, _ in pyogrio.list_layers(path)}
+    study  = gpd.read_file(path, layer=STUDY_LAYER, engine="pyogrio")
+    bbox   = {key: float(study[key].iloc[0]) for key in ("south", "north", "west", "east")}
+
+    features = {}
+    for name in ("freeways", "rivers", "airports", "runways"):
+        if name in layers:
+            features[name] = gpd.read_file(path, layer=name, engine="pyogrio")
+        else:
+            features[name] = gpd.GeoDataFrame(geometry=[], crs=CRS_WGS84)
+    return bbox, features
+
+
+# ---------------------------------------------------------------------------
+# ZONES
+# ---------------------------------------------------------------------------
+
+def buffer_distances(gdf_m: gpd.GeoDataFrame, buffer_key: str, runways_m=None):
+    """Per-feature buffer distances (m) for one CRS_METRIC feature layer.
+
+    An aerodrome with a runway line on it gets only the small "airfield" buffer:
+    its flight_zone corridors model the approach exposure, which a flat circle
+    over-flags beside the runway.  Without runway lines the full circle applies.
+    A buffer_m column (decided upstream, see statewide.py) is used as is.
+    """
+    import numpy as np
+    import shapely
+
+    if "buffer_m" in gdf_m.columns:
+        return gdf_m["buffer_m"].to_numpy(dtype=float)
+    dist = np.full(len(gdf_m), float(BUFFERS[buffer_key]))
+    if buffer_key == "airport" and runways_m is not None and len(runways_m) and len(gdf_m):
+        tree = shapely.STRtree(runways_m.geometry.values)
+        with_runway, _ = tree.query(gdf_m.geometry.values, predicate="intersects")
+        dist[np.unique(with_runway)] = BUFFERS["airfield"]
+    return dist
+
+
+def buffer_features(gdf_m: gpd.GeoDataFrame, dist):
+    """Metric buffers of each feature, at the arc resolution every zone build shares."""
+    import shapely
+
+    return shapely.buffer(gdf_m.geometry.values, dist, quad_segs=BUFFER_QUAD_SEGS)
+
+
+def build_exclusion_zones(features: dict, corridor: dict = FLIGHT_CORRIDOR) -> dict:
+    """Buffer each hazard layer in metres and dissolve it into one zone polygon.
+
+    Runway lines become approach / departure corridors instead of a buffer.
+    """
+    import geopandas as gpd
+    from shapely.ops import unary_union
+
+    print("\n  Building exclusion zones...")
+    runways   = features.get("runways")
+    runways_m = runways.to_crs(CRS_METRIC) if runways is not None and not runways.empty else None
+
+    zones = {}
+    for zone_name, (feature_name, buffer_key) in ZONE_SOURCES.items():
+        gdf = features.get(feature_name)
+        if gdf is None or gdf.empty:
+            continue
+        gdf_m  = gdf.to_crs(CRS_METRIC)
+        dist   = buffer_distances(gdf_m, buffer_key, runways_m)
+        merged = unary_union(buffer_features(gdf_m, dist))
+        zones[zone_name] = gpd.GeoDataFrame(geometry=[merged], crs=CRS_METRIC).to_crs(CRS_WGS84)
+        if buffer_key == "airport":
+            circles = int((dist == BUFFERS["airport"]).sum())
+            print(f"    {zone_name:<13} buffer {BUFFERS['airport']} m ({circles} without runway lines), "
+                  f"{BUFFERS['airfield']} m otherwise")
+        else:
+            print(f"    {zone_name:<13} buffer {BUFFERS[buffer_key]} m")
+
+    if runways is not None and not runways.empty:
+        from flight_paths import build_flight_zone
+
+        zones["flight_zone"] = build_flight_zone(runways, corridor)
+        print(f"    {'flight_zone':<13} {len(runways)} runways, "
+              f"{corridor['length_m']} m cones to {2 * corridor['outer_half_width_m']} m wide")
+    return zones
+
+
+def build_safe_zone(
+    zones:      dict,
+    study_area: gpd.GeoDataFrame,
+    inclusions: dict | None = None,
+) -> gpd.GeoDataFrame:
+    """Study area inside every inclusion layer, minus every exclusion zone."""
+    import geopandas as gpd
+    from shapely.ops import unary_union
+
+    study_geom = study_area.to_crs(CRS_METRIC).geometry.iloc[0]
+    for gdf in (inclusions or {}).values():
+        study_geom = study_geom.intersection(unary_union(list(gdf.to_crs(CRS_METRIC).geometry)))
+    excluded   = [g for gdf in zones.values() for g in gdf.to_crs(CRS_METRIC).geometry]
+    safe_geom  = study_geom.difference(unary_union(excluded)) if excluded else study_geom
+
+    if safe_geom.is_empty:
+        return gpd.GeoDataFrame(geometry=[], crs=CRS_WGS84)
+    return gpd.GeoDataFrame(geometry=[safe_geom], crs=CRS_METRIC).to_crs(CRS_WGS84)
+
+
+def report_livable(study_area: gpd.GeoDataFrame, safe_zone: gpd.GeoDataFrame) -> None:
+    study_area_m2 = study_area.to_crs(CRS_METRIC).geometry.iloc[0].area
+    safe_area_m2  = safe_zone.to_crs(CRS_METRIC).geometry.iloc[0].area if not safe_zone.empty else 0
+    pct_safe      = (safe_area_m2 / study_area_m2) * 100 if study_area_m2 > 0 else 0
+
+    print(f"\n  Study area  : {study_area_m2 / 1_000_000:.1f} km²")
+    print(f"  Safe area   : {safe_area_m2  / 1_000_000:.1f} km²")
+    print(f"  % livable   : {pct_safe:.1f}%")
+
+
+def load_zones(path: Path) -> tuple[dict, dict, gpd.GeoDataFrame]:
+    """Read back (zones, inclusions, safe_zone) written by save_outputs()."""
+    import geopandas as gpd
+    import pyogrio
+
+    layers = {
+        name: gpd.read_file(path, layer=name, engine="pyogrio")
+        for name, _ in pyogrio.list_layers(path)
+    }
+    safe_zone  = layers.pop(SAFE_LAYER)
+    inclusions = {name: layers.pop(name) for name in INCLUSION_RULES if name in layers}
+    return layers, inclusions, safe_zone
+
+
+def inclusion_rules(args) -> dict:
+    """INCLUSION_RULES with the radii chosen on the command line (0 / unset = off)."""
+    radii = {"care_zone": args.care_km, "food_zone": args.food_km}
+    return {
+        layer: (categories, radii[layer] * 1000)
+        for layer, (categories, _) in INCLUSION_RULES.items()
+        if radii[layer]
+    }
+
+
+def inclusion_reach_m(rules: dict) -> float:
+    """Largest active inclusion radius — how far past the bbox amenities still count."""
+    return max((radius_m for _, radius_m in rules.values()), default=0.0)
+
+
+def flight_corridor(args) -> dict:
+    """FLIGHT_CORRIDOR with any command-line overrides."""
+    return {
+        "length_m":           args.corridor_length_m,
+        "inner_half_width_m": FLIGHT_CORRIDOR["inner_half_width_m"],
+        "outer_half_width_m": args.corridor_width_m / 2,
+    }
+
+
+def build_inclusions(args) -> dict:
+    """Inclusion zones from AMENITIES_NPZ, or none if extract hasn't produced it."""
+    rules = inclusion_rules(args)
+    if not rules:
+        return {}
+    if not AMENITIES_NPZ.exists():
+        print(f"\n  No {AMENITIES_NPZ} — skipping inclusion layers (re-run extract with the radii)")
+        return {}
+    from amenities import amenities_reach_m, build_inclusion_zones, load_amenities
+
+    extracted_m = amenities_reach_m(AMENITIES_NPZ)
+    if inclusion_reach_m(rules) > extracted_m:
+        print(f"  WARNING: {AMENITIES_NPZ} was extracted for radii up to {extracted_m / 1000:g} km — "
+              f"sites just outside the bbox are missing; re-run extract with these radii")
+    return build_inclusion_zones(load_amenities(AMENITIES_NPZ), rules)
+
 
 # ---------------------------------------------------------------------------
 # VISUALIZATION  (matplotlib static — lonboard coming next phase)
@@ -5,8 +397,15 @@
 
 ZONE_STYLES = {
     "freeway_zone": dict(color="#e74c3c", alpha=0.35, label=f"Freeway exclusion ({BUFFERS['freeway']}m / ~2,000 ft)"),
-    "airport_zone": dict(color="#e67e22", alpha=0.25, label=f"Airport exclusion ({BUFFERS['airport']}m / ~5 mi)"),
+    "airport_zone": dict(color="#e67e22", alpha=0.25, label=f"Airport grounds ({BUFFERS['airfield']}m; {BUFFERS['airport']}m if no runway mapped)"),
     "river_zone":   dict(color="#2980b9", alpha=0.40, label=f"River/flood corridor ({BUFFERS['river']}m)"),
+    "flight_zone":  dict(color="#d35400", alpha=0.30, label=f"Flight-path corridor ({FLIGHT_CORRIDOR['length_m']}m cones)"),
+}
+
+# Inclusion layers are drawn as outlines — the safe fill already sits inside them
+INCLUSION_STYLES = {
+    "care_zone": dict(color="#f1c40f", label="Within reach of hospital / dialysis"),
+    "food_zone": dict(color="#9b59b6", label="Within walking distance of a supermarket"),
 }
 
 
@@ -16,8 +415,13 @@ def plot_map(
     zones:      dict,
     safe_zone:  gpd.GeoDataFrame,
     output_path: Path,
+    show:       bool = True,
+    inclusions: dict | None = None,
 ) -> None:
     """Render and save the exclusion + safe zone map as a PNG."""
+    import geopandas as gpd
+    import matplotlib.patches as mpatches
+    import matplotlib.pyplot as plt
 
     print("\n  Rendering map...")
 
@@ -40,6 +444,11 @@ def plot_map(
         style = ZONE_STYLES.get(zone_name, {})
         gdf.plot(ax=ax, color=style["color"], alpha=style["alpha"])
 
+    # Inclusion outlines
+    for zone_name, gdf in (inclusions or {}).items():
+        if not gdf.empty:
+            gdf.boundary.plot(ax=ax, color=INCLUSION_STYLES[zone_name]["color"], linewidth=1.0, linestyle="--")
+
     # Raw features (subtle)
     if not features["freeways"].empty:
         features["freeways"].plot(ax=ax, color="#c0392b", linewidth=0.6, alpha=0.5)
@@ -55,6 +464,11 @@ def plot_map(
             legend_patches.append(
                 mpatches.Patch(color=style["color"], alpha=0.7, label=style["label"])
             )
+    for zone_name, style in INCLUSION_STYLES.items():
+        if zone_name in (inclusions or {}):
+            legend_patches.append(
+                mpatches.Patch(edgecolor=style["color"], facecolor="none", linestyle="--", label=style["label"])
+            )
 
     ax.legend(
         handles=legend_patches,
@@ -82,7 +496,8 @@ def plot_map(
     plt.tight_layout()
     plt.savefig(output_path, dpi=300, facecolor=fig.get_facecolor())
     print(f"  Map saved → {output_path.resolve()}")
-    plt.show()
+    if show:
+        plt.show()
 
 
 # ---------------------------------------------------------------------------
@@ -93,6 +508,7 @@ def save_outputs(safe_zone: gpd.GeoDataFrame, zones: dict) -> None:
     """Save safe zone and exclusion zones to GeoPackage for GIS use."""
     print("\n  Saving vector outputs...")
 
+    OUTPUT_SAFE_SHP.unlink(missing_ok=True)   # no stale zone layers from an earlier run
     safe_zone.to_file(OUTPUT_SAFE_SHP, layer="safe_zones", driver="GPKG")
 
     for zone_name, gdf in zones.items():
@@ -102,24 +518,290 @@ def save_outputs(safe_zone: gpd.GeoDataFrame, zones: dict) -> None:
 
 
 # ---------------------------------------------------------------------------
-# CLI
+# QUERY  (numpy + shapely + pyogrio only — no geopandas / matplotlib)
 # ---------------------------------------------------------------------------
 
-def parse_args():
-    parser = argparse.ArgumentParser(
-        description="Sanctuary Map — health-based residential zone finder for San Diego, CA"
+def query_points(zones_path: Path, points: list[tuple[float, float]]) -> list[dict]:
+    """Verdicts for (lat, lon) points against the saved zone GeoPackage."""
+    with import_timer("query"):
+        import numpy as np
+        import pyogrio
+        import shapely
+        from pyogrio.raw import read as read_raw
+
+    lats = np.array([p[0] for p in points])
+    lons = np.array([p[1] for p in points])
+
+    inside = {}
+    for name, _ in pyogrio.list_layers(zones_path):
+        meta, _fids, wkb, _fields = read_raw(zones_path, layer=name, read_geometry=True)
+        geom = shapely.union_all(shapely.from_wkb(wkb))
+        x, y = lons, lats
+        if meta["crs"] and meta["crs"].upper() != CRS_WGS84:
+            from pyproj import Transformer
+
+            x, y = Transformer.from_crs(CRS_WGS84, meta["crs"], always_xy=True).transform(lons, lats)
+        inside[name] = shapely.contains_xy(geom, x, y)
+
+    nearest = {}
+    if AMENITIES_NPZ.exists():
+        from amenities import AmenityIndex
+
+        nearest = AmenityIndex.from_file(AMENITIES_NPZ).nearest_lonlat(lats, lons)
+
+    hazards    = [name for name in inside if is_hazard_layer(name)]
+    inclusions = [name for name in inside if name in INCLUSION_RULES]
+    results = []
+    for i in range(len(points)):
+        zones_hit = [name for name in hazards if inside[name][i]]
+        safe = bool(inside[SAFE_LAYER][i]) if SAFE_LAYER in inside else not zones_hit
+        results.append({
+            "lat":     float(lats[i]),
+            "lon":     float(lons[i]),
+            "safe":    safe,
+            "zones":   zones_hit,
+            "outside": [name for name in inclusions if not inside[name][i]],
+            "nearest_m": {
+                cat: (round(float(d[i]), 1) if np.isfinite(d[i]) else None)
+                for cat, d in nearest.items()
+            },
+        })
+    return results
+
+
+def parse_point(text: str) -> tuple[float, float]:
+    try:
+        lat, lon = [float(v.strip()) for v in text.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"point must be 'lat,lon', got {text!r}")
+    return lat, lon
+
+
+# ---------------------------------------------------------------------------
+# SUBCOMMANDS
+# ---------------------------------------------------------------------------
+
+def cmd_extract(args) -> None:
+    with import_timer("extract"):
+        import geopandas  # noqa: F401  (pyogrio-backed PBF reads)
+
+    bbox = parse_bbox(args.bbox)
+    check_pbf(args.pbf)
+    features = extract_features(args.pbf, bbox)
+    save_features(features, bbox, args.features)
+
+    AMENITIES_NPZ.unlink(missing_ok=True)   # no stale amenities from an earlier bbox
+    rules = inclusion_rules(args)
+    if rules:
+        from amenities import extract_amenities, save_amenities
+
+        reach = inclusion_reach_m(rules)
+        save_amenities(extract_amenities(args.pbf, bbox, reach), AMENITIES_NPZ, reach)
+
+
+def cmd_zones(args) -> None:
+    with import_timer("zones"):
+        import geopandas as gpd
+
+    check_file(args.features, "extract")
+    bbox, features = load_features(args.features)
+    study_area = gpd.GeoDataFrame(geometry=[bbox_polygon(bbox)], crs=CRS_WGS84)
+
+    zones      = build_exclusion_zones(features, flight_corridor(args))
+    inclusions = build_inclusions(args)
+    safe_zone  = build_safe_zone(zones, study_area, inclusions)
+    report_livable(study_area, safe_zone)
+    save_outputs(safe_zone, {**zones, **inclusions})
+
+
+def cmd_render(args) -> None:
+    with import_timer("render"):
+        import geopandas  # noqa: F401
+        import matplotlib.pyplot  # noqa: F401
+
+    check_file(args.features, "extract")
+    check_file(OUTPUT_SAFE_SHP, "zones")
+    bbox, features = load_features(args.features)
+    zones, inclusions, safe_zone = load_zones(OUTPUT_SAFE_SHP)
+    plot_map(bbox, features, zones, safe_zone, args.output, show=args.show, inclusions=inclusions)
+
+
+def cmd_query(args) -> None:
+    check_file(OUTPUT_SAFE_SHP, "zones")
+    results = query_points(OUTPUT_SAFE_SHP, args.points)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        verdict = "SAFE " if r["safe"] else "AVOID"
+        reasons = r["zones"] + [f"outside {name}" for name in r["outside"]]
+        detail  = f"  ({', '.join(reasons)})" if reasons else ""
+        near    = "".join(
+            f"  {cat} {d / 1000:.1f} km" for cat, d in r["nearest_m"].items() if d is not None
+        )
+        print(f"  {r['lat']:.5f}, {r['lon']:.5f}  {verdict}{detail}{near}")
+
+
+def cmd_serve(args) -> None:
+    with import_timer("serve"):
+        import sanctuary_server
+
+    check_file(OUTPUT_SAFE_SHP, "zones")
+    sanctuary_server.run(OUTPUT_SAFE_SHP, args.port, args.workers)
+
+
+def cmd_all(args) -> None:
+    """Original single-shot pipeline: extract → zones → render (→ save)."""
+    with import_timer("all"):
+        import geopandas as gpd
+        import matplotlib.pyplot  # noqa: F401
+
+    bbox = parse_bbox(args.bbox)
+
+    # Validate PBF
+    check_pbf(args.pbf)
+
+    # Study area polygon
+    study_area = gpd.GeoDataFrame(
+        geometry=[bbox_polygon(bbox)], crs=CRS_WGS84
     )
+
+    # Extract → buffer → compute safe zone → visualize
+    features   = extract_features(args.pbf, bbox)
+    zones      = build_exclusion_zones(features, flight_corridor(args))
+    inclusions = {}
+    if inclusion_rules(args):
+        from amenities import build_inclusion_zones, extract_amenities, save_amenities
+
+        reach      = inclusion_reach_m(inclusion_rules(args))
+        amenities  = extract_amenities(args.pbf, bbox, reach)
+        save_amenities(amenities, AMENITIES_NPZ, reach)
+        inclusions = build_inclusion_zones(amenities, inclusion_rules(args))
+    safe_zone  = build_safe_zone(zones, study_area, inclusions)
+
+    report_livable(study_area, safe_zone)
+
+    # Outputs
+    plot_map(bbox, features, zones, safe_zone, OUTPUT_MAP_PNG, inclusions=inclusions)
+
+    if not args.no_save:
+        save_outputs(safe_zone, {**zones, **inclusions})
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def add_common_args(parser: argparse.ArgumentParser, suppress: bool) -> None:
+    """Options accepted both before and after the subcommand name.
+
+    Subcommands use SUPPRESS defaults so they never clobber a value given at the top level.
+    """
+    default = (lambda value: argparse.SUPPRESS) if suppress else (lambda value: value)
     parser.add_argument(
         "--bbox",
         type=str,
-        default=None,
+        default=default(None),
         help='Bounding box as "south,north,west,east" — default is full SD County',
     )
+    parser.add_argument(
+        "--pbf",
+        type=Path,
+        default=default(PBF_FILE),
+        help=f"OSM extract to read (default: {PBF_FILE})",
+    )
+    parser.add_argument(
+        "--timing",
+        action="store_true",
+        default=default(False),
+        help="Print import and total time for the subcommand",
+    )
+
+
+def add_zone_args(parser: argparse.ArgumentParser, suppress: bool = False) -> None:
+    """Zone options; suppress=True for subcommands, as in add_common_args()."""
+    default = (lambda value: argparse.SUPPRESS) if suppress else (lambda value: value)
+    parser.add_argument(
+        "--corridor-length-m",
+        type=float,
+        default=default(FLIGHT_CORRIDOR["length_m"]),
+        help=f"Flight-path cone length past each runway end (default: {FLIGHT_CORRIDOR['length_m']})",
+    )
+    parser.add_argument(
+        "--corridor-width-m",
+        type=float,
+        default=default(2 * FLIGHT_CORRIDOR["outer_half_width_m"]),
+        help=f"Flight-path cone width at its far end (default: {2 * FLIGHT_CORRIDOR['outer_half_width_m']})",
+    )
+    add_inclusion_args(parser, suppress)
+
+
+def add_inclusion_args(parser: argparse.ArgumentParser, suppress: bool = False) -> None:
+    """Inclusion radii — off unless asked for, so the plain pipeline is unchanged."""
+    default = (lambda value: argparse.SUPPRESS) if suppress else (lambda value: value)
+    care_km = INCLUSION_RULES["care_zone"][1] / 1000
+    parser.add_argument(
+        "--care-km",
+        type=float,
+        default=default(0),
+        help=f"Safe areas must be within this many km of a hospital/dialysis centre "
+             f"(e.g. {care_km:g}; default: off)",
+    )
+    parser.add_argument(
+        "--food-km",
+        type=float,
+        default=default(0),
+        help="Safe areas must be within this many km of a supermarket (e.g. 1.2; default: off)",
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Sanctuary Map — health-based residential zone finder for San Diego, CA"
+    )
+    add_common_args(parser, suppress=False)
     parser.add_argument(
         "--no-save",
         action="store_true",
         help="Skip saving GeoPackage outputs (map PNG is always saved)",
     )
+    add_zone_args(parser)
+    parser.set_defaults(func=cmd_all, features=FEATURES_GPKG)
+
+    sub = parser.add_subparsers(title="subcommands", metavar="{extract,zones,render,query,serve}")
+
+    p = sub.add_parser("extract", help=f"PBF → {FEATURES_GPKG}")
+    p.add_argument("--features", type=Path, default=FEATURES_GPKG, help="Output GeoPackage")
+    add_inclusion_args(p, suppress=True)      # amenities are only extracted for these radii
+    add_common_args(p, suppress=True)
+    p.set_defaults(func=cmd_extract)
+
+    p = sub.add_parser("zones", help=f"{FEATURES_GPKG} → {OUTPUT_SAFE_SHP}")
+    p.add_argument("--features", type=Path, default=FEATURES_GPKG, help="Input GeoPackage")
+    add_zone_args(p, suppress=True)
+    add_common_args(p, suppress=True)
+    p.set_defaults(func=cmd_zones)
+
+    p = sub.add_parser("render", help=f"Saved zones → {OUTPUT_MAP_PNG}")
+    p.add_argument("--features", type=Path, default=FEATURES_GPKG, help="Input GeoPackage")
+    p.add_argument("--output", type=Path, default=OUTPUT_MAP_PNG, help="PNG to write")
+    p.add_argument("--show", action="store_true", help="Open the map window after saving")
+    add_common_args(p, suppress=True)
+    p.set_defaults(func=cmd_render)
+
+    p = sub.add_parser("query", help="Safe / avoid verdict for lat,lon points")
+    p.add_argument("points", nargs="+", type=parse_point, metavar="LAT,LON")
+    p.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+    add_common_args(p, suppress=True)
+    p.set_defaults(func=cmd_query)
+
+    p = sub.add_parser("serve", help="Run the local query / tile service")
+    p.add_argument("--port", type=int, default=8765, help="Port on 127.0.0.1")
+    p.add_argument("--workers", type=int, default=None, help="Scoring threads / tile processes")
+    add_common_args(p, suppress=True)
+    p.set_defaults(func=cmd_serve)
+
     return parser.parse_args()
 
 
@@ -128,54 +810,23 @@ def parse_args():
 # ---------------------------------------------------------------------------
 
 def main():
-    print("\n" + "=" * 60)
-    print("  SANCTUARY MAP  —  San Diego Health Zone Finder")
-    print("=" * 60)
-
-    args = parse_args()
-
-    # Resolve bounding box
-    bbox = DEFAULT_BBOX.copy()
-    if args.bbox:
-        try:
-            s, n, w, e = [float(v.strip()) for v in args.bbox.split(",")]
-            bbox = {"south": s, "north": n, "west": w, "east": e}
-            print(f"\n  Custom bbox: S={s} N={n} W={w} E={e}")
-        except ValueError:
-            print("  ERROR: --bbox must be 'south,north,west,east'")
-            sys.exit(1)
-    else:
-        print(f"\n  Using default bbox: full San Diego County")
-
-    # Validate PBF
-    check_pbf(PBF_FILE)
-
-    # Study area polygon
-    study_area = gpd.GeoDataFrame(
-        geometry=[bbox_polygon(bbox)], crs=CRS_WGS84
-    )
-
-    # Extract → buffer → compute safe zone → visualize
-    features  = extract_features(PBF_FILE, bbox)
-    zones     = build_exclusion_zones(features)
-    safe_zone = build_safe_zone(zones, study_area)
-
-    # Report
-    study_area_m2 = study_area.to_crs(CRS_METRIC).geometry.iloc[0].area
-    safe_area_m2  = safe_zone.to_crs(CRS_METRIC).geometry.iloc[0].area if not safe_zone.empty else 0
-    pct_safe      = (safe_area_m2 / study_area_m2) * 100 if study_area_m2 > 0 else 0
+    global TIMING, _T_START
 
-    print(f"\n  Study area  : {study_area_m2 / 1_000_000:.1f} km²")
-    print(f"  Safe area   : {safe_area_m2  / 1_000_000:.1f} km²")
-    print(f"  % livable   : {pct_safe:.1f}%")
+    _T_START = time.perf_counter()
+    args   = parse_args()
+    TIMING = args.timing
+    name   = args.func.__name__.removeprefix("cmd_")
 
-    # Outputs
-    plot_map(bbox, features, zones, safe_zone, OUTPUT_MAP_PNG)
+    if name != "query":
+        print("\n" + "=" * 60)
+        print("  SANCTUARY MAP  —  San Diego Health Zone Finder")
+        print("=" * 60)
 
-    if not args.no_save:
-        save_outputs(safe_zone, zones)
+    args.func(args)
 
-    print("\n  Done.\n")
+    report_total(name)
+    if name != "query":
+        print("\n  Done.\n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,508 @@
+"""
+sanctuary_server.py
+-------------------
+Long-running local HTTP service for the Sanctuary Map.
+
+Loads the precomputed zones from the GeoPackage written by `sanctuary_map.py`
+ONCE, then answers questions from the warm process instead of rebuilding
+everything per run:
+
+  GET  /score?lat=32.75&lon=-117.15     → safety verdict for one point
+  POST /score                           → batch verdicts for candidate addresses
+                                          body: [{"lat": .., "lon": .., "id": ..}, ...]
+  GET  /tiles/{z}/{x}/{y}.png           → 256 px hazard overlay tile (Web Mercator)
+  GET  /health                          → layer names + feature counts
+
+Addresses must already be geocoded (lat/lon); any extra keys are echoed back.
+
+Binds to 127.0.0.1 only.  Scoring runs in a thread pool (shapely 2 releases the
+GIL inside its vectorized predicates); tile rendering runs in a process pool
+because matplotlib holds the GIL.  Rendered tiles are kept in a small LRU cache.
+
+    ./uv run sanctuary_server.py --port 8765
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import geopandas as gpd
+import numpy as np
+import pyogrio
+import shapely
+from matplotlib.figure import Figure
+from pyproj import Transformer
+
+from amenities import AmenityIndex
+from sanctuary_map import (
+    AMENITIES_NPZ,
+    CRS_METRIC,
+    CRS_WGS84,
+    INCLUSION_RULES,
+    OUTPUT_SAFE_SHP,
+    SAFE_LAYER,
+    ZONE_STYLES,
+    is_hazard_layer,
+)
+
+# ---------------------------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------------------------
+
+CRS_TILES    = "EPSG:3857"               # Web Mercator — slippy map tiles
+
+HOST         = "127.0.0.1"
+PORT         = 8765
+TILE_PX      = 256
+TILE_CACHE   = 1024                      # rendered tiles kept in memory
+MAX_BODY     = 8 * 1024 * 1024           # 8 MB of batch JSON
+MAX_BATCH    = 100_000                   # addresses per POST
+
+MERCATOR_HALF = 20037508.342789244       # half the Web Mercator world width (m)
+
+DEFAULT_TILE_STYLE = dict(color="#8e44ad", alpha=0.30)
+
+
+# ---------------------------------------------------------------------------
+# ZONE INDEX  (loaded once per process)
+# ---------------------------------------------------------------------------
+
+class TileIndex:
+    """Hazard polygon parts in CRS_TILES + STRtrees — all a tile renderer needs."""
+
+    def __init__(self, gpkg_path: Path):
+        if not gpkg_path.exists():
+            raise FileNotFoundError(
+                f"{gpkg_path} not found — run sanctuary_map.py first to build the zones"
+            )
+
+        self.path   = gpkg_path
+        self.layers = [name for name, _ in pyogrio.list_layers(gpkg_path)]
+        self.hazard_names    = [name for name in self.layers if is_hazard_layer(name)]
+        self.inclusion_names = [name for name in self.layers if name in INCLUSION_RULES]
+
+        self.parts  = {}    # layer → array of polygon parts in CRS_TILES
+        self.trees  = {}    # layer → STRtree over self.parts[layer]
+        self.counts = {}
+
+        for name in self.layers_to_load():
+            gdf = gpd.read_file(gpkg_path, layer=name, engine="pyogrio")
+            gdf = gdf[~gdf.geometry.is_empty & gdf.geometry.notna()]
+            self.counts[name] = len(gdf)
+            self.add_layer(name, gdf)
+
+    def layers_to_load(self) -> list[str]:
+        return self.hazard_names
+
+    def add_layer(self, name: str, gdf: gpd.GeoDataFrame) -> None:
+        if name in self.hazard_names:
+            parts = shapely.get_parts(gdf.to_crs(CRS_TILES).geometry.values)
+            self.parts[name] = parts
+            self.trees[name] = shapely.STRtree(parts)
+
+    # -- tiles --------------------------------------------------------------
+
+    def render_tile(self, z: int, x: int, y: int) -> bytes:
+        """Render one transparent PNG overlay tile of the hazard zones."""
+        xmin, ymin, xmax, ymax = tile_bounds(z, x, y)
+        window = shapely.box(xmin, ymin, xmax, ymax)
+
+        fig = Figure(figsize=(1, 1), dpi=TILE_PX)
+        ax  = fig.add_axes([0, 0, 1, 1])
+        ax.set_axis_off()
+
+        for name in self.hazard_names:
+            hits = self.trees[name].query(window, predicate="intersects")
+            if len(hits) == 0:
+                continue
+            clipped = shapely.clip_by_rect(self.parts[name][hits], xmin, ymin, xmax, ymax)
+            style = ZONE_STYLES.get(name, DEFAULT_TILE_STYLE)
+            gpd.GeoSeries(clipped, crs=CRS_TILES).plot(
+                ax=ax, color=style["color"], alpha=style["alpha"], linewidth=0
+            )
+
+        ax.set_xlim(xmin, xmax)
+        ax.set_ylim(ymin, ymax)
+
+        buf = BytesIO()
+        fig.savefig(buf, format="png", transparent=True)
+        return buf.getvalue()
+
+
+class ZoneIndex(TileIndex):
+    """Every zone layer, prepared for point queries (plus the tile parts)."""
+
+    def __init__(self, gpkg_path: Path):
+        self.metric = {}    # layer → single prepared geometry in CRS_METRIC
+        super().__init__(gpkg_path)
+
+        self.to_metric = Transformer.from_crs(CRS_WGS84, CRS_METRIC, always_xy=True)
+
+        # KD-trees for nearest hospital / dialysis / grocery, if extract produced them
+        amenities_path = gpkg_path.parent / AMENITIES_NPZ.name
+        self.amenities = AmenityIndex.from_file(amenities_path) if amenities_path.exists() else None
+
+    def layers_to_load(self) -> list[str]:
+        return self.layers
+
+    def add_layer(self, name: str, gdf: gpd.GeoDataFrame) -> None:
+        super().add_layer(name, gdf)
+        merged = shapely.union_all(gdf.to_crs(CRS_METRIC).geometry.values)
+        shapely.prepare(merged)
+        self.metric[name] = merged
+
+    # -- scoring ------------------------------------------------------------
+
+    def score(self, lats: np.ndarray, lons: np.ndarray) -> list[dict]:
+        """Vectorized verdicts for arrays of WGS84 points."""
+        x, y = self.to_metric.transform(lons, lats)
+        points = shapely.points(x, y)
+
+        inside   = {}
+        distance = {}
+        for name in self.hazard_names:
+            geom = self.metric[name]
+            inside[name]   = shapely.contains_xy(geom, x, y)
+            distance[name] = shapely.distance(geom, points)
+        for name in self.inclusion_names:
+            inside[name] = shapely.contains_xy(self.metric[name], x, y)
+
+        nearest = {}
+        if self.amenities is not None:
+            xy = np.column_stack([x, y])
+            nearest = {cat: self.amenities.nearest(xy, cat) for cat in self.amenities.categories}
+
+        if SAFE_LAYER in self.metric:
+            safe = shapely.contains_xy(self.metric[SAFE_LAYER], x, y)
+        else:
+            safe = ~np.logical_or.reduce([inside[n] for n in self.hazard_names]) \
+                if self.hazard_names else np.ones(len(x), dtype=bool)
+
+        results = []
+        for i in range(len(x)):
+            results.append({
+                "lat":   float(lats[i]),
+                "lon":   float(lons[i]),
+                "safe":  bool(safe[i]),
+                "zones": [n for n in self.hazard_names if inside[n][i]],
+                "outside": [n for n in self.inclusion_names if not inside[n][i]],
+                "distance_m": {
+                    n: (round(float(distance[n][i]), 1) if np.isfinite(distance[n][i]) else None)
+                    for n in self.hazard_names
+                },
+                "nearest_m": {
+                    cat: (round(float(d[i]), 1) if np.isfinite(d[i]) else None)
+                    for cat, d in nearest.items()
+                },
+            })
+        return results
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """Web Mercator bounds (xmin, ymin, xmax, ymax) of slippy tile z/x/y."""
+    size = 2 * MERCATOR_HALF / (2 ** z)
+    xmin = -MERCATOR_HALF + x * size
+    ymax =  MERCATOR_HALF - y * size
+    return xmin, ymax - size, xmin + size, ymax
+
+
+# Process-pool workers each keep their own warm TileIndex (no unions / KD-trees).
+_WORKER_INDEX = None
+
+
+def _init_tile_worker(gpkg_path: str) -> None:
+    global _WORKER_INDEX
+    _WORKER_INDEX = TileIndex(Path(gpkg_path))
+
+
+def _render_in_worker(z: int, x: int, y: int) -> bytes:
+    return _WORKER_INDEX.render_tile(z, x, y)
+
+
+# ---------------------------------------------------------------------------
+# HTTP  (minimal HTTP/1.1 on asyncio streams — localhost only)
+# ---------------------------------------------------------------------------
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status  = status
+        self.message = message
+
+
+REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 500: "Internal Server Error",
+}
+
+
+class SanctuaryServer:
+    """Routes requests to the warm ZoneIndex via thread / process pools."""
+
+    def __init__(self, index: ZoneIndex, workers: int):
+        self.index      = index
+        self.threads    = ThreadPoolExecutor(max_workers=workers)
+        self.processes  = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_tile_worker,
+            initargs=(str(index.path),),
+        )
+        self.tile_cache = OrderedDict()
+        self.pending    = {}     # (z, x, y) → in-flight future, so hot tiles render once
+
+    # -- connection loop ----------------------------------------------------
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+
+                try:
+                    status, ctype, payload = await self.route(method, target, body)
+                except HttpError as exc:
+                    status, ctype = exc.status, "application/json"
+                    payload = json.dumps({"error": exc.message}).encode()
+                except Exception as exc:   # keep the service alive on bad data
+                    status, ctype = 500, "application/json"
+                    payload = json.dumps({"error": str(exc)}).encode()
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(format_response(status, ctype, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except HttpError as exc:
+            payload = json.dumps({"error": exc.message}).encode()
+            writer.write(format_response(exc.status, "application/json", payload, False))
+        finally:
+            writer.close()
+
+    async def route(self, method: str, target: str, body: bytes) -> tuple[int, str, bytes]:
+        url   = urlsplit(target)
+        parts = [p for p in url.path.split("/") if p]
+
+        if parts == ["health"]:
+            return json_response({"layers": self.index.counts})
+
+        if parts == ["score"]:
+            if method == "GET":
+                return await self.score_query(parse_qs(url.query))
+            if method == "POST":
+                return await self.score_batch(body)
+            raise HttpError(405, "use GET or POST for /score")
+
+        if len(parts) == 4 and parts[0] == "tiles" and parts[3].endswith(".png"):
+            if method != "GET":
+                raise HttpError(405, "use GET for /tiles")
+            try:
+                z, x, y = int(parts[1]), int(parts[2]), int(parts[3][:-4])
+            except ValueError:
+                raise HttpError(400, "tile path must be /tiles/{z}/{x}/{y}.png")
+            if not (0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+                raise HttpError(400, f"tile {z}/{x}/{y} is outside the tile pyramid")
+            return 200, "image/png", await self.tile(z, x, y)
+
+        raise HttpError(404, f"no route for {url.path}")
+
+    # -- handlers -----------------------------------------------------------
+
+    async def score_query(self, query: dict) -> tuple[int, str, bytes]:
+        try:
+            lat = float(query["lat"][0])
+            lon = float(query["lon"][0])
+        except (KeyError, ValueError):
+            raise HttpError(400, "/score needs numeric ?lat=&lon=")
+        check_latlon(np.array([lat]), np.array([lon]))
+
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(
+            self.threads, self.index.score, np.array([lat]), np.array([lon])
+        )
+        return json_response(results[0])
+
+    async def score_batch(self, body: bytes) -> tuple[int, str, bytes]:
+        try:
+            items = json.loads(body)
+        except json.JSONDecodeError:
+            raise HttpError(400, "POST body must be a JSON list of {lat, lon} objects")
+        if not isinstance(items, list):
+            raise HttpError(400, "POST body must be a JSON list of {lat, lon} objects")
+        if len(items) > MAX_BATCH:
+            raise HttpError(413, f"at most {MAX_BATCH} addresses per request")
+        if not items:
+            return json_response([])
+
+        try:
+            lats = np.array([float(item["lat"]) for item in items])
+            lons = np.array([float(item["lon"]) for item in items])
+        except (KeyError, TypeError, ValueError):
+            raise HttpError(400, "every address needs numeric 'lat' and 'lon'")
+        check_latlon(lats, lons)
+
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(self.threads, self.index.score, lats, lons)
+
+        for item, result in zip(items, results):
+            for key, value in item.items():
+                result.setdefault(key, value)
+        return json_response(results)
+
+    async def tile(self, z: int, x: int, y: int) -> bytes:
+        key = (z, x, y)
+        if key in self.tile_cache:
+            self.tile_cache.move_to_end(key)
+            return self.tile_cache[key]
+
+        if key not in self.pending:
+            loop = asyncio.get_running_loop()
+            self.pending[key] = loop.run_in_executor(self.processes, _render_in_worker, z, x, y)
+        try:
+            png = await asyncio.shield(self.pending[key])
+        finally:
+            self.pending.pop(key, None)
+
+        self.tile_cache[key] = png
+        if len(self.tile_cache) > TILE_CACHE:
+            self.tile_cache.popitem(last=False)
+        return png
+
+    def shutdown(self) -> None:
+        self.threads.shutdown(wait=False, cancel_futures=True)
+        self.processes.shutdown(wait=False, cancel_futures=True)
+
+
+def check_latlon(lats: np.ndarray, lons: np.ndarray) -> None:
+    if not (np.all(np.abs(lats) <= 90) and np.all(np.abs(lons) <= 180)):
+        raise HttpError(400, "lat must be within ±90 and lon within ±180")
+
+
+def json_response(obj) -> tuple[int, str, bytes]:
+    return 200, "application/json", json.dumps(obj).encode()
+
+
+async def read_line(reader: asyncio.StreamReader) -> bytes:
+    """One CRLF line; over-long lines are a client error, not a crash."""
+    try:
+        return await reader.readline()
+    except (ValueError, asyncio.LimitOverrunError):
+        raise HttpError(400, "header line too long")
+
+
+async def read_request(reader: asyncio.StreamReader):
+    """Read one request → (method, target, headers, body), or None on EOF."""
+    line = await read_line(reader)
+    if not line:
+        return None
+    try:
+        method, target, _version = line.decode("latin-1").split()
+    except ValueError:
+        raise HttpError(400, "malformed request line")
+
+    headers = {}
+    while True:
+        line = await read_line(reader)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0) or 0)
+    except ValueError:
+        raise HttpError(400, "Content-Length must be an integer")
+    if length < 0:
+        raise HttpError(400, "Content-Length must not be negative")
+    if length > MAX_BODY:
+        raise HttpError(413, f"request body over {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+
+def format_response(status: int, ctype: str, payload: bytes, keep_alive: bool) -> bytes:
+    head = (
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        f"Content-Type: {ctype}\r\n"
+        f"Content-Length: {len(payload)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        "\r\n"
+    )
+    return head.encode("latin-1") + payload
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Sanctuary Map — local safety query + hazard tile service"
+    )
+    parser.add_argument(
+        "--zones",
+        type=Path,
+        default=OUTPUT_SAFE_SHP,
+        help=f"GeoPackage of precomputed zones (default: {OUTPUT_SAFE_SHP})",
+    )
+    parser.add_argument("--port", type=int, default=PORT, help=f"Port on {HOST} (default: {PORT})")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Threads for scoring and processes for tile rendering (default: half the cores)",
+    )
+    return parser.parse_args()
+
+
+async def serve(index: ZoneIndex, port: int, workers: int) -> None:
+    app    = SanctuaryServer(index, workers)
+    server = await asyncio.start_server(app.handle, HOST, port)
+    print(f"  Listening on http://{HOST}:{port}  (Ctrl+C to stop)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        app.shutdown()
+
+
+def run(zones_path: Path, port: int = PORT, workers: int | None = None) -> None:
+    """Load the zones once and serve until Ctrl+C."""
+    workers = workers or max(2, (os.cpu_count() or 2) // 2)
+
+    print(f"\n  Loading zones from {zones_path} ...")
+    try:
+        index = ZoneIndex(zones_path)
+    except FileNotFoundError as exc:
+        print(f"  ERROR: {exc}")
+        sys.exit(1)
+    for name, count in index.counts.items():
+        print(f"    {name:<14} {count:>6} features")
+
+    try:
+        asyncio.run(serve(index, port, workers))
+    except KeyboardInterrupt:
+        print("\n  Stopped.\n")
+
+
+def main():
+    args = parse_args()
+    run(args.zones, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+"""
+statewide.py
+------------
+Memory-bounded, out-of-core zone build for whole-extract runs
+(all of Southern California from the socal PBF).
+
+The in-memory pipeline loads every hazard feature into one GeoDataFrame and
+dissolves each layer with one giant union.  Here nothing larger than one
+spatial window is ever resident:
+
+  1. stream   read the PBF in Arrow batches, keep hazard / amenity rows only,
+              and spill each feature to every PART_DEG partition its zone can
+              reach  (zone_spill/<layer>/<partition>/<batch>.parquet)
+  2. build    per partition, estimate what its features will cost in memory;
+              over the per-worker budget → split into quadrants (down to a
+              single tile), otherwise load just that window and build its
+              zone tiles (zone_tiles.py)
+  3. write    append tile pieces to safe_zones.gpkg a chunk of tiles at a
+              time (zone_tiles.write_zones) — clipped to the bbox per tile,
+              never dissolved statewide
+
+Peak memory (main process and largest worker) is reported at the end, against
+the --max-ram-gb ceiling.  The tile cache is marked as statewide: pbf_diff.py
+update reads the whole extract into memory, so it refuses these caches — re-run
+statewide.py on the new snapshot instead.
+
+    ./uv run statewide.py --pbf socal-latest.osm.pbf --max-ram-gb 12 --workers 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import math
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from sanctuary_map import (
+    AMENITIES_NPZ,
+    CRS_METRIC,
+    CRS_WGS84,
+    FLIGHT_CORRIDOR,
+    PBF_FILE,
+    add_inclusion_args,
+    buffer_distances,
+    check_pbf,
+    inclusion_reach_m,
+    inclusion_rules,
+    parse_bbox,
+    select_features,
+)
+from zone_tiles import (
+    AMENITIES,
+    M_PER_DEG,
+    TILE_DEG,
+    ZONE_TILES_DIR,
+    FeatureSet,
+    TileCache,
+    build_tile,
+    feature_ids,
+    feature_index,
+    grid_units,
+    influence_m,
+    write_zones,
+)
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+
+
+# ---------------------------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------------------------
+
+# Approximate extent of the Geofabrik socal extract
+SOCAL_BBOX = {"south": 32.53, "north": 35.81, "west": -120.71, "east": -114.13}
+
+SPILL_DIR      = Path("zone_spill")
+PART_DEG       = 1.0         # spill partitions (multiple of TILE_DEG)
+BATCH_ROWS     = 65_536      # Arrow batch size for the PBF stream
+MEM_FACTOR     = 40          # resident bytes per spilled WKB byte while building (buffers, trees)
+HEADROOM       = 0.75        # share of --max-ram-gb handed to tile builds
+DEFAULT_RAM_GB = 12.0
+GIB            = 2 ** 30
+
+
+# ---------------------------------------------------------------------------
+# PEAK MEMORY
+# ---------------------------------------------------------------------------
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (0 if the platform won't say)."""
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize",
+                    "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage",
+                    "PagefileUsage", "PeakPagefileUsage",
+                )
+            ]
+
+        counters = Counters(cb=ctypes.sizeof(Counters))
+        process  = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return 0.0
+        return counters.PeakWorkingSetSize / 2 ** 20
+
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10   # bytes vs KB
+
+
+# ---------------------------------------------------------------------------
+# 1. STREAM + SPILL
+# ---------------------------------------------------------------------------
+
+def partition_key(pi: int, pj: int) -> str:
+    return f"p{pi}_{pj}"
+
+
+def spill_features(gdf: gpd.GeoDataFrame, layer: str, batch_no: int, reach_m: float,
+                   spill: Path, bbox: dict, part_deg: float) -> None:
+    """Write each feature to every partition its zone can reach (+ buffer_m, if decided)."""
+    import pandas as pd
+    import shapely
+
+    geoms  = gdf.geometry.values
+    bounds = shapely.bounds(geoms)
+    wkb    = shapely.to_wkb(geoms)
+    rows   = pd.DataFrame({
+        "id":     feature_ids(gdf).to_numpy(),
+        "wkb":    wkb,
+        "nbytes": [len(w) for w in wkb],
+        "minx":   bounds[:, 0], "miny": bounds[:, 1],
+        "maxx":   bounds[:, 2], "maxy": bounds[:, 3],
+    })
+    if "buffer_m" in gdf.columns:
+        rows["buffer_m"] = gdf["buffer_m"].to_numpy()
+
+    dlat = reach_m / M_PER_DEG
+    dlon = reach_m / (M_PER_DEG * math.cos(math.radians(max(abs(bbox["south"]), abs(bbox["north"])))))
+    lo_i, hi_i = math.floor(grid_units(bbox["west"], part_deg)), math.floor(grid_units(bbox["east"], part_deg))
+    lo_j, hi_j = math.floor(grid_units(bbox["south"], part_deg)), math.floor(grid_units(bbox["north"], part_deg))
+    # partition ranges each zone can reach, clamped to the study partitions
+    i0 = np.clip(np.floor((bounds[:, 0] - dlon) / part_deg), lo_i, hi_i).astype(int)
+    i1 = np.clip(np.floor((bounds[:, 2] + dlon) / part_deg), lo_i, hi_i).astype(int)
+    j0 = np.clip(np.floor((bounds[:, 1] - dlat) / part_deg), lo_j, hi_j).astype(int)
+    j1 = np.clip(np.floor((bounds[:, 3] + dlat) / part_deg), lo_j, hi_j).astype(int)
+
+    targets = {}
+    for r in range(len(rows)):
+        for pi in range(i0[r], i1[r] + 1):
+            for pj in range(j0[r], j1[r] + 1):
+                targets.setdefault(partition_key(pi, pj), []).append(r)
+
+    for key, idx in targets.items():
+        out = spill / layer / key
+        out.mkdir(parents=True, exist_ok=True)
+        rows.iloc[idx].to_parquet(out / f"{batch_no:06d}.parquet", index=False)
+
+
+def stream_pbf(pbf_path: Path, bbox: dict, spill: Path, part_deg: float, corridor: dict,
+               amenity_reach_m: float = 0.0):
+    """One batched pass per PBF layer → spilled hazard features, feature index, amenities.
+
+    Amenities are read from the bbox grown by amenity_reach_m (amenity_bbox);
+    hazards only from the bbox itself.
+
+    Runway lines stream first (the lines layer), so each aerodrome's buffer —
+    airfield or full circle — is decided once here and spilled with it; a window
+    that loads the aerodrome but not its runway still buffers it the same way.
+    """
+    import geopandas as gpd
+    import pandas as pd
+    import shapely
+    from pyogrio.raw import open_arrow
+
+    from amenities import amenity_bbox, select_amenities
+
+    reach   = influence_m(corridor)
+    window  = (bbox["west"], bbox["south"], bbox["east"], bbox["north"])
+    wide    = amenity_bbox(bbox, amenity_reach_m)
+    wide    = (wide["west"], wide["south"], wide["east"], wide["north"])
+    study   = shapely.box(*window)
+    empty   = gpd.GeoDataFrame(geometry=[], crs=CRS_WGS84)
+    counts  = {name: 0 for name in reach}
+    index   = []
+    amenity = []
+    runways = []
+    runways_m = None
+    batch_no = 0
+
+    for layer in ("lines", "multipolygons", "points"):
+        print(f"  Streaming PBF layer '{layer}'...")
+        if layer == "multipolygons":
+            runways_m = pd.concat(runways, ignore_index=True).to_crs(CRS_METRIC) if runways else None
+        layer_window = window if layer == "lines" else wide
+        with open_arrow(pbf_path, layer=layer, bbox=layer_window, batch_size=BATCH_ROWS,
+                        use_pyarrow=True) as (meta, reader):
+            geom_col = meta["geometry_name"] or "wkb_geometry"
+            for batch in reader:
+                df  = batch.to_pandas()
+                gdf = gpd.GeoDataFrame(
+                    df.drop(columns=[geom_col]), geometry=shapely.from_wkb(df[geom_col]),
+                    crs=meta["crs"] or CRS_WGS84,
+                )
+                del df
+                if layer == "multipolygons" and amenity_reach_m:
+                    hazard = gdf[shapely.intersects(gdf.geometry.values, study)]
+                else:
+                    hazard = gdf
+                if layer != "points":
+                    selected = select_features(
+                        hazard if layer == "lines" else empty,
+                        hazard if layer == "multipolygons" else empty,
+                    )
+                    for name, feats in selected.items():
+                        if feats.empty:
+                            continue
+                        if name == "runways":
+                            runways.append(feats[["geometry"]])
+                        if name == "airports":
+                            feats = feats.assign(buffer_m=buffer_distances(
+                                feats.to_crs(CRS_METRIC), "airport", runways_m))
+                        spill_features(feats, name, batch_no, reach[name], spill, bbox, part_deg)
+                        counts[name] += len(feats)
+                    index.append(feature_index(selected))
+                if layer != "lines":
+                    amenity.append(select_amenities([gdf]))
+                batch_no += 1
+        print(f"    {batch_no} batches so far, peak {peak_rss_mb():,.0f} MB")
+
+    for name, n in counts.items():
+        print(f"    {name:<10} {n:>8} features")
+
+    amenities = {
+        cat: np.vstack([a[cat] for a in amenity]) if amenity else np.empty((0, 2))
+        for cat in (amenity[0] if amenity else {})
+    }
+    index = pd.concat(index, ignore_index=True) if index else feature_index({})
+    return index.drop_duplicates(["layer", "id"]), amenities
+
+
+# ---------------------------------------------------------------------------
+# 2. BUILD  (memory-budgeted windows, one worker task per partition)
+# ---------------------------------------------------------------------------
+
+def window_filters(layer: str, window: tuple, reach: dict, max_lat: float) -> list:
+    """Parquet filters selecting spilled features whose zone reaches the window."""
+    w, s, e, n = window
+    dlat = reach[layer] / M_PER_DEG
+    dlon = reach[layer] / (M_PER_DEG * math.cos(math.radians(max_lat)))
+    return [("maxx", ">=", w - dlon), ("minx", "<=", e + dlon),
+            ("maxy", ">=", s - dlat), ("miny", "<=", n + dlat)]
+
+
+def window_cost(spill: Path, part: str, window: tuple, reach: dict, max_lat: float) -> int:
+    """Estimated resident bytes to build the window (spilled WKB × MEM_FACTOR)."""
+    import pandas as pd
+
+    total = 0
+    for layer in reach:
+        src = spill / layer / part
+        if src.exists():
+            sizes = pd.read_parquet(src, columns=["nbytes"], filters=window_filters(layer, window, reach, max_lat))
+            total += int(sizes["nbytes"].sum())
+    return total * MEM_FACTOR
+
+
+def load_window(spill: Path, part: str, window: tuple, reach: dict, max_lat: float) -> dict:
+    """Spilled features reaching the window → {layer: GeoDataFrame} like extract_features()."""
+    import geopandas as gpd
+    import pandas as pd
+    import shapely
+
+    features = {}
+    for layer in reach:
+        src = spill / layer / part
+        if not src.exists():
+            features[layer] = gpd.GeoDataFrame(geometry=[], crs=CRS_WGS84)
+            continue
+        columns = ["id", "wkb"] + (["buffer_m"] if layer == "airports" else [])
+        rows = pd.read_parquet(src, columns=columns, filters=window_filters(layer, window, reach, max_lat))
+        features[layer] = gpd.GeoDataFrame(
+            rows.drop(columns=["wkb"]).rename(columns={"id": "osm_id"}),
+            geometry=shapely.from_wkb(rows["wkb"].to_numpy()), crs=CRS_WGS84,
+        )
+    return features
+
+
+def build_window(cache: TileCache, spill: Path, part: str, tiles: tuple, budget: int, max_lat: float) -> int:
+    """Build tiles i0..i1 × j0..j1 (inclusive), splitting while over budget. Returns #tiles."""
+    i0, i1, j0, j1 = tiles
+    deg = cache.tile_deg
+    window = (i0 * deg, j0 * deg, (i1 + 1) * deg, (j1 + 1) * deg)
+    reach = influence_m(cache.corridor)
+
+    if window_cost(spill, part, window, reach, max_lat) > budget and (i1 > i0 or j1 > j0):
+        im, jm = (i0 + i1) // 2, (j0 + j1) // 2
+        quads = [(i0, im, j0, jm), (im + 1, i1, j0, jm), (i0, im, jm + 1, j1), (im + 1, i1, jm + 1, j1)]
+        return sum(
+            build_window(cache, spill, part, q, budget, max_lat)
+            for q in quads if q[0] <= q[1] and q[2] <= q[3]
+        )
+
+    fs = FeatureSet(load_window(spill, part, window, reach, max_lat), cache.corridor)
+    for i in range(i0, i1 + 1):
+        for j in range(j0, j1 + 1):
+            cache.write_tile(i, j, build_tile(fs, i, j, deg))
+    return (i1 - i0 + 1) * (j1 - j0 + 1)
+
+
+def build_partition(root: str, spill: str, part: str, tiles: tuple, budget: int, max_lat: float):
+    """Worker task: build one partition's tiles → (manifest entries, worker peak MB)."""
+    cache = TileCache(Path(root))
+    built = build_window(cache, Path(spill), part, tiles, budget, max_lat)
+    print(f"    {part}: {built} tiles, worker peak {peak_rss_mb():,.0f} MB")
+    return cache.manifest["tiles"], peak_rss_mb()
+
+
+def partitions(bbox: dict, part_deg: float, tile_deg: float) -> dict[str, tuple]:
+    """{partition key: (i0, i1, j0, j1) tile range}, clipped to the bbox."""
+    ti0, ti1 = math.floor(grid_units(bbox["west"], tile_deg)), math.ceil(grid_units(bbox["east"], tile_deg)) - 1
+    tj0, tj1 = math.floor(grid_units(bbox["south"], tile_deg)), math.ceil(grid_units(bbox["north"], tile_deg)) - 1
+    per = round(part_deg / tile_deg)
+    parts = {}
+    for pi in range(math.floor(grid_units(bbox["west"], part_deg)), math.floor(grid_units(bbox["east"], part_deg)) + 1):
+        for pj in range(math.floor(grid_units(bbox["south"], part_deg)), math.floor(grid_units(bbox["north"], part_deg)) + 1):
+            i0, i1 = max(pi * per, ti0), min((pi + 1) * per - 1, ti1)
+            j0, j1 = max(pj * per, tj0), min((pj + 1) * per - 1, tj1)
+            if i0 <= i1 and j0 <= j1:
+                parts[partition_key(pi, pj)] = (i0, i1, j0, j1)
+    return parts
+
+
+# ---------------------------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Out-of-core zone build for whole-extract runs")
+    parser.add_argument("--pbf", type=Path, default=PBF_FILE, help=f"OSM extract (default: {PBF_FILE})")
+    parser.add_argument("--bbox", type=str, default=None, help='"south,north,west,east" (default: whole socal extract)')
+    parser.add_argument("--max-ram-gb", type=float, default=DEFAULT_RAM_GB, help=f"Memory ceiling (default: {DEFAULT_RAM_GB:g})")
+    parser.add_argument("--workers", type=int, default=1, help="Partition build processes — they share the ceiling (default: 1)")
+    parser.add_argument("--part-deg", type=float, default=PART_DEG, help=f"Spill partition size in degrees (default: {PART_DEG:g})")
+    parser.add_argument("--tile-deg", type=float, default=TILE_DEG, help=f"Tile size in degrees (default: {TILE_DEG})")
+    parser.add_argument("--root", type=Path, default=ZONE_TILES_DIR, help="Tile cache directory")
+    parser.add_argument("--spill", type=Path, default=SPILL_DIR, help="Scratch directory for spilled features")
+    parser.add_argument("--keep-spill", action="store_true", help="Leave the spill directory in place")
+    add_inclusion_args(parser)
+    args = parser.parse_args()
+
+    if abs(args.part_deg / args.tile_deg - round(args.part_deg / args.tile_deg)) > 1e-9:
+        print("  ERROR: --part-deg must be a multiple of --tile-deg")
+        sys.exit(1)
+    bbox = parse_bbox(args.bbox) if args.bbox else SOCAL_BBOX.copy()
+    check_pbf(args.pbf)
+    ceiling = int(args.max_ram_gb * GIB)
+    budget  = int(ceiling * HEADROOM / args.workers)
+    max_lat = max(abs(bbox["south"]), abs(bbox["north"]))
+    t0 = time.perf_counter()
+
+    from amenities import save_amenities
+
+    # 1. stream
+    shutil.rmtree(args.spill, ignore_errors=True)
+    amenity_reach = inclusion_reach_m(inclusion_rules(args))
+    index, amenities = stream_pbf(args.pbf, bbox, args.spill, args.part_deg, FLIGHT_CORRIDOR, amenity_reach)
+    if amenities:
+        save_amenities(amenities, AMENITIES_NPZ, amenity_reach)
+    print(f"  Streamed in {time.perf_counter() - t0:.1f} s")
+
+    # 2. build
+    cache = TileCache(args.root)
+    cache.start(args.pbf.name, bbox, dict(FLIGHT_CORRIDOR), args.tile_deg, mode="statewide")
+    if inclusion_rules(args):
+        save_amenities(amenities, cache.root / AMENITIES, amenity_reach)
+    parts = partitions(bbox, args.part_deg, args.tile_deg)
+    print(f"\n  Building {len(parts)} partitions on {args.workers} process(es), "
+          f"{budget / GIB:.1f} GB budget each...")
+    t1 = time.perf_counter()
+    worker_peak = 0.0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [
+            pool.submit(build_partition, str(args.root), str(args.spill), part, tiles, budget, max_lat)
+            for part, tiles in parts.items()
+        ]
+        for future in futures:
+            built, peak = future.result()
+            cache.manifest["tiles"].update(built)
+            worker_peak = max(worker_peak, peak)
+    cache.save_manifest()
+    cache.write_feature_index(index)
+    print(f"  {len(cache.manifest['tiles'])} tiles in {time.perf_counter() - t1:.1f} s")
+    if not args.keep_spill:
+        shutil.rmtree(args.spill, ignore_errors=True)
+
+    # 3. write
+    write_zones(cache, cache.inclusions(args))
+
+    main_peak = peak_rss_mb()
+    bound = main_peak + args.workers * worker_peak
+    print(f"\n  Peak memory : main {main_peak:,.0f} MB, largest worker {worker_peak:,.0f} MB "
+          f"(≤ {bound / 1024:.1f} GB of {args.max_ram_gb:g} GB)")
+    if bound * 2 ** 20 > ceiling:
+        print("  WARNING: over the ceiling — lower --workers or --part-deg")
+    print(f"  Total time  : {time.perf_counter() - t0:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+zonal_stats.py
+--------------
+Per-polygon hazard / safe fractions for any polygon layer
+(parcels, census blocks, ZIP codes …).
+
+For every input polygon this reports the share of its area inside each
+exclusion zone, inside any exclusion ("hazard"), and inside the safe zone,
+read from safe_zones.gpkg.  Two engines, both batched over a process pool:
+
+  exact   (default)  zones are cut into GRID_M squares once, indexed in an
+                     STRtree; each polygon only intersects the few small pieces
+                     it touches — vectorized shapely, no overlay()
+  raster             zones and polygons are burned onto a CELL_M grid per batch
+                     and counted with bincount; polygons smaller than MIN_CELLS
+                     cells fall back to exact.  Grids are capped at MAX_CELLS
+                     (a batch over it is halved, a lone polygon over it is
+                     measured exactly), and polygons overlapping another in
+                     their batch are measured exactly — a cell holds one label
+
+Polygons are Hilbert-sorted before batching, so each batch is spatially compact.
+Output is a GeoParquet table ranked by frac_safe.
+
+    ./uv run zonal_stats.py parcels.gpkg --id APN -o parcel_safety.parquet
+    ./uv run zonal_stats.py tl_2023_06_tabblock20.zip --method raster --cell-m 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from sanctuary_map import CRS_METRIC, OUTPUT_SAFE_SHP, check_file, load_zones
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+
+
+# ---------------------------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------------------------
+
+GRID_M     = 2_000     # zone pieces for the exact engine
+CELL_M     = 10.0      # raster engine cell size
+MIN_CELLS  = 16        # polygons covering fewer cells are measured exactly
+MAX_CELLS  = 20_000_000  # raster grid cap per burn (~80 MB of int32 labels)
+BATCH      = 5_000     # polygons per worker task
+OUTPUT     = Path("zonal_stats.parquet")
+HAZARD     = "hazard"
+SAFE       = "safe"
+
+
+# ---------------------------------------------------------------------------
+# ZONE PIECES
+# ---------------------------------------------------------------------------
+
+def grid_pieces(geom, grid_m: float = GRID_M) -> np.ndarray:
+    """Cut a (multi)polygon into non-overlapping pieces no larger than grid_m squares."""
+    import shapely
+
+    if geom is None or geom.is_empty:
+        return np.empty(0, dtype=object)
+    parts = shapely.get_parts(geom)
+    xmin, ymin, xmax, ymax = geom.bounds
+    xs = np.arange(np.floor(xmin / grid_m) * grid_m, xmax, grid_m)
+    ys = np.arange(np.floor(ymin / grid_m) * grid_m, ymax, grid_m)
+    gx, gy = (a.ravel() for a in np.meshgrid(xs, ys))
+    boxes = shapely.box(gx, gy, gx + grid_m, gy + grid_m)
+
+    box_i, part_i = shapely.STRtree(parts).query(boxes, predicate="intersects")
+    pieces = shapely.intersection(parts[part_i], boxes[box_i])
+    pieces = pieces[~shapely.is_empty(pieces)]
+    return pieces[shapely.area(pieces) > 0]
+
+
+def zone_layers(zones_path: Path, grid_m: float = GRID_M) -> dict[str, np.ndarray]:
+    """{layer: metric WKB pieces} for every exclusion zone, their union, and the safe zone."""
+    import shapely
+
+    zones, _, safe_zone = load_zones(zones_path)
+
+    def metric_union(gdf):
+        if gdf.empty:
+            return shapely.Polygon()
+        return shapely.union_all(gdf.to_crs(CRS_METRIC).geometry.values)
+
+    geoms = {name: metric_union(gdf) for name, gdf in zones.items()}
+    geoms[HAZARD] = shapely.union_all(list(geoms.values()))
+    geoms[SAFE]   = metric_union(safe_zone)
+
+    layers = {}
+    for name, geom in geoms.items():
+        pieces = grid_pieces(geom, grid_m)
+        layers[name] = shapely.to_wkb(pieces)
+        print(f"    {name:<13} {len(pieces):>7} pieces")
+    return layers
+
+
+# ---------------------------------------------------------------------------
+# ENGINES  (run inside worker processes)
+# ---------------------------------------------------------------------------
+
+_WORKER_PIECES = None
+_WORKER_TREES  = None
+
+
+def _init_zonal_worker(layers: dict[str, np.ndarray]) -> None:
+    global _WORKER_PIECES, _WORKER_TREES
+    import shapely
+
+    _WORKER_PIECES = {name: shapely.from_wkb(wkb) for name, wkb in layers.items()}
+    _WORKER_TREES  = {name: shapely.STRtree(p) for name, p in _WORKER_PIECES.items()}
+
+
+def exact_areas(polys: np.ndarray) -> dict[str, np.ndarray]:
+    """{layer: m² of each polygon inside the layer} by STRtree pair intersection."""
+    import shapely
+
+    areas = {}
+    for name, tree in _WORKER_TREES.items():
+        poly_i, piece_i = tree.query(polys, predicate="intersects")
+        overlap = shapely.area(shapely.intersection(polys[poly_i], _WORKER_PIECES[name][piece_i]))
+        areas[name] = np.bincount(poly_i, weights=overlap, minlength=len(polys))
+    return areas
+
+
+def burn_areas(polys: np.ndarray, cell_m: float) -> dict[str, np.ndarray]:
+    """{layer: m² of each polygon inside the layer} by burning one grid over them all.
+
+    Polygons must not overlap: a cell keeps only the last label burned into it.
+    """
+    import shapely
+    from affine import Affine
+    from rasterio.features import rasterize
+
+    xmin, ymin, xmax, ymax = shapely.total_bounds(polys)
+    width  = max(int(np.ceil((xmax - xmin) / cell_m)), 1)
+    height = max(int(np.ceil((ymax - ymin) / cell_m)), 1)
+    transform = Affine(cell_m, 0, xmin, 0, -cell_m, ymax)
+    shape = (height, width)
+
+    labels = rasterize(
+        zip(polys, range(1, len(polys) + 1)), out_shape=shape, transform=transform,
+        fill=0, dtype="int32",
+    ).ravel()
+    n = len(polys) + 1
+    cells = np.bincount(labels, minlength=n)[1:]
+
+    window = shapely.box(xmin, ymin, xmax, ymax)
+    areas = {}
+    for name, tree in _WORKER_TREES.items():
+        hits = tree.query(window, predicate="intersects")
+        if len(hits) == 0:
+            areas[name] = np.zeros(len(polys))
+            continue
+        burned = rasterize(
+            ((g, 1) for g in _WORKER_PIECES[name][hits]), out_shape=shape, transform=transform,
+            fill=0, dtype="uint8",
+        ).ravel()
+        inside = np.bincount(labels, weights=burned, minlength=n)[1:]
+        # cell counts → polygon-area shares, so fractions stay consistent with area_m2
+        with np.errstate(invalid="ignore", divide="ignore"):
+            areas[name] = np.where(cells > 0, inside / cells, 0) * shapely.area(polys)
+
+    small = np.flatnonzero(cells < MIN_CELLS)
+    if len(small):
+        exact = exact_areas(polys[small])
+        for name in areas:
+            areas[name][small] = exact[name]
+    return areas
+
+
+def grid_areas(polys: np.ndarray, cell_m: float) -> dict[str, np.ndarray]:
+    """burn_areas() on grids of at most MAX_CELLS; halves the (Hilbert-sorted) run if over."""
+    import shapely
+
+    xmin, ymin, xmax, ymax = shapely.total_bounds(polys)
+    cells = np.ceil((xmax - xmin) / cell_m) * np.ceil((ymax - ymin) / cell_m)
+    if cells <= MAX_CELLS:
+        return burn_areas(polys, cell_m)
+    if len(polys) == 1:
+        return exact_areas(polys)
+    half  = len(polys) // 2
+    parts = grid_areas(polys[:half], cell_m), grid_areas(polys[half:], cell_m)
+    return {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+
+
+def overlapping(polys: np.ndarray) -> np.ndarray:
+    """Mask of polygons whose interior overlaps another polygon of the batch."""
+    import shapely
+
+    left, right = shapely.STRtree(polys).query(polys, predicate="intersects")
+    pair = left < right
+    left, right = left[pair], right[pair]
+    hit = shapely.relate_pattern(polys[left], polys[right], "T********")
+    mask = np.zeros(len(polys), dtype=bool)
+    mask[left[hit]] = True
+    mask[right[hit]] = True
+    return mask
+
+
+def raster_areas(polys: np.ndarray, cell_m: float) -> dict[str, np.ndarray]:
+    """{layer: m² of each polygon inside the layer} on capped grids; overlaps measured exactly."""
+    shared = overlapping(polys)
+    if not shared.any():
+        return grid_areas(polys, cell_m)
+    if shared.all():
+        return exact_areas(polys)
+    areas = {name: np.zeros(len(polys)) for name in _WORKER_TREES}
+    for mask, result in ((~shared, grid_areas(polys[~shared], cell_m)), (shared, exact_areas(polys[shared]))):
+        for name in areas:
+            areas[name][mask] = result[name]
+    return areas
+
+
+def _zonal_batch(wkb: np.ndarray, method: str, cell_m: float) -> dict[str, np.ndarray]:
+    import shapely
+
+    polys = shapely.from_wkb(wkb)
+    if method == "raster":
+        return raster_areas(polys, cell_m)
+    return exact_areas(polys)
+
+
+# ---------------------------------------------------------------------------
+# DRIVER
+# ---------------------------------------------------------------------------
+
+def zonal_stats(
+    polygons: gpd.GeoDataFrame,
+    zones_path: Path = OUTPUT_SAFE_SHP,
+    method: str = "exact",
+    cell_m: float = CELL_M,
+    workers: int | None = None,
+) -> gpd.GeoDataFrame:
+    """polygons + area_m2 + frac_<layer> columns, sorted by frac_safe (highest first)."""
+    import shapely
+
+    geom = polygons.geometry
+    polygons = polygons[geom.notna() & ~geom.is_empty]
+
+    print("\n  Cutting zone layers into pieces...")
+    layers = zone_layers(zones_path)
+
+    metric = polygons.geometry.to_crs(CRS_METRIC)
+    order  = np.argsort(metric.hilbert_distance().to_numpy(), kind="stable")
+    wkb    = shapely.to_wkb(metric.values)[order]
+    batches = [wkb[i:i + BATCH] for i in range(0, len(wkb), BATCH)]
+
+    workers = workers or os.cpu_count() or 2
+    print(f"  {len(polygons)} polygons → {len(batches)} batches on {workers} processes ({method})...")
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_zonal_worker, initargs=(layers,),
+    ) as pool:
+        results = list(pool.map(
+            _zonal_batch, batches, [method] * len(batches), [cell_m] * len(batches),
+        ))
+    print(f"  Done in {time.perf_counter() - t0:.1f} s")
+
+    area = shapely.area(metric.values)
+    out  = polygons.copy()
+    out["area_m2"] = area
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for name in layers:
+            sorted_area = np.concatenate([r[name] for r in results])
+            layer_area  = np.empty_like(sorted_area)
+            layer_area[order] = sorted_area
+            out[f"frac_{name}"] = np.clip(np.where(area > 0, layer_area / area, 0), 0, 1)
+    return out.sort_values(f"frac_{SAFE}", ascending=False, kind="stable")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-polygon hazard / safe fractions → GeoParquet")
+    parser.add_argument("polygons", type=Path, help="Any OGR polygon file (parcels, census blocks, ZIPs)")
+    parser.add_argument("--layer", type=str, default=None, help="Layer name inside the polygon file")
+    parser.add_argument("--id", type=str, default=None, help="Keep only this id column (default: all columns)")
+    parser.add_argument("--zones", type=Path, default=OUTPUT_SAFE_SHP, help=f"Zone GeoPackage (default: {OUTPUT_SAFE_SHP})")
+    parser.add_argument("--method", choices=("exact", "raster"), default="exact", help="Overlay engine (default: exact)")
+    parser.add_argument("--cell-m", type=float, default=CELL_M, help=f"Raster cell size in metres (default: {CELL_M:g})")
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: all cores)")
+    parser.add_argument("-o", "--output", type=Path, default=OUTPUT, help=f"GeoParquet output (default: {OUTPUT})")
+    args = parser.parse_args()
+
+    import geopandas as gpd
+
+    check_file(args.zones, "zones")
+    polygons = gpd.read_file(args.polygons, layer=args.layer, engine="pyogrio")
+    if args.id:
+        polygons = polygons[[args.id, polygons.geometry.name]]
+    print(f"  Loaded {len(polygons)} polygons from {args.polygons}")
+
+    stats = zonal_stats(polygons, args.zones, args.method, args.cell_m, args.workers)
+    stats.to_parquet(args.output)
+    print(f"  Zonal stats → {args.output.resolve()}")
+
+    cols = [c for c in stats.columns if c.startswith("frac_")]
+    print("\n  Mean over polygons:")
+    for col in cols:
+        print(f"    {col:<18} {stats[col].mean():.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,514 @@
+"""
+zone_tiles.py
+-------------
+Tiled cache of the exclusion / safe zones.
+
+The study area is cut into TILE_DEG × TILE_DEG tiles.  Each tile keeps its own
+clipped zone pieces in zone_tiles/<i>_<j>.parquet, and depends only on features
+within `influence_m()` of it — so when the OSM data changes, only the tiles near
+the change are rebuilt (see pbf_diff.py).  write_zones() puts the pieces into
+the usual safe_zones.gpkg layers, one row per tile piece (never dissolved), and
+on an update replaces just the rebuilt tiles' rows — query / render / serve
+read it unchanged.
+
+    zone_tiles/
+      manifest.json        snapshot, bbox, tile size, corridor, built tiles
+                           (+ safe m² per tile, inclusion-zone hash)
+      features.parquet     per-feature id + geometry hash + bounds (for diffs)
+      amenities.npz        amenities from the same PBF (only with inclusion radii)
+      <i>_<j>.parquet      layer, geometry (CRS_WGS84), clipped to the tile
+
+    ./uv run zone_tiles.py build --bbox "32.70,32.80,-117.20,-117.10"
+    ./uv run zone_tiles.py merge                 # full rewrite of safe_zones.gpkg
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from sanctuary_map import (
+    BUFFERS,
+    CRS_METRIC,
+    CRS_WGS84,
+    FLIGHT_CORRIDOR,
+    OUTPUT_SAFE_SHP,
+    PBF_FILE,
+    SAFE_LAYER,
+    ZONE_SOURCES,
+    add_inclusion_args,
+    bbox_polygon,
+    buffer_distances,
+    buffer_features,
+    check_pbf,
+    extract_features,
+    inclusion_reach_m,
+    inclusion_rules,
+    parse_bbox,
+)
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+    import pandas as pd
+
+
+# ---------------------------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------------------------
+
+TILE_DEG       = 0.05                # ~5 km tiles
+ZONE_TILES_DIR = Path("zone_tiles")
+FEATURE_INDEX  = "features.parquet"
+AMENITIES      = "amenities.npz"
+TILE_COLUMN    = "tile"              # per-piece tile key in the GeoPackage layers
+WRITE_TILES    = 64                  # tiles appended to the GeoPackage per write
+M_PER_DEG      = 111_320.0
+
+
+# ---------------------------------------------------------------------------
+# TILE GRID
+# ---------------------------------------------------------------------------
+
+def tile_key(i: int, j: int) -> str:
+    return f"{i}_{j}"
+
+
+def parse_tile_key(key: str) -> tuple[int, int]:
+    i, j = key.split("_")
+    return int(i), int(j)
+
+
+def tile_bounds(i: int, j: int, tile_deg: float = TILE_DEG) -> tuple[float, float, float, float]:
+    """(west, south, east, north) of tile (i, j)."""
+    return i * tile_deg, j * tile_deg, (i + 1) * tile_deg, (j + 1) * tile_deg
+
+
+def grid_units(value: float, deg: float) -> float:
+    """value / deg, snapped so -117.1 / 0.05 is -2342 rather than -2341.9999999999995."""
+    return round(value / deg, 9)
+
+
+def tiles_for_bounds(west, south, east, north, tile_deg: float = TILE_DEG) -> list[tuple[int, int]]:
+    """Every tile touching the lon/lat rectangle."""
+    i0, i1 = math.floor(grid_units(west, tile_deg)), math.ceil(grid_units(east, tile_deg))
+    j0, j1 = math.floor(grid_units(south, tile_deg)), math.ceil(grid_units(north, tile_deg))
+    return [(i, j) for j in range(j0, max(j1, j0 + 1)) for i in range(i0, max(i1, i0 + 1))]
+
+
+def expand_bounds(west, south, east, north, metres: float) -> tuple[float, float, float, float]:
+    """Grow a lon/lat rectangle by `metres` on every side (conservative at the pole-ward edge)."""
+    dlat = metres / M_PER_DEG
+    dlon = metres / (M_PER_DEG * math.cos(math.radians(max(abs(south), abs(north)))))
+    return west - dlon, south - dlat, east + dlon, north + dlat
+
+
+def influence_m(corridor: dict = FLIGHT_CORRIDOR) -> dict:
+    """How far each feature layer's zone reaches from the feature itself."""
+    reach = {feature: BUFFERS[buffer_key] for feature, buffer_key in ZONE_SOURCES.values()}
+    reach["runways"] = corridor["length_m"] + corridor["outer_half_width_m"]
+    return reach
+
+
+# ---------------------------------------------------------------------------
+# FEATURE INDEX  (what a tile depends on — used to diff snapshots)
+# ---------------------------------------------------------------------------
+
+def feature_ids(gdf: gpd.GeoDataFrame) -> pd.Series:
+    """Stable OSM id per row: osm_id, or "w<osm_way_id>" for way-built multipolygons."""
+    import pandas as pd
+
+    ids = pd.Series(pd.NA, index=gdf.index, dtype="string")
+    if "osm_id" in gdf.columns:
+        ids = ids.fillna(gdf["osm_id"].astype("string"))
+    if "osm_way_id" in gdf.columns:
+        ids = ids.fillna("w" + gdf["osm_way_id"].astype("string"))
+    return ids
+
+
+def feature_index(features: dict) -> pd.DataFrame:
+    """One row per feature: layer, id, geometry hash, WGS84 bounds."""
+    import pandas as pd
+    import shapely
+
+    frames = []
+    for layer, gdf in features.items():
+        if gdf.empty:
+            continue
+        geoms = gdf.to_crs(CRS_WGS84).geometry.values
+        # ~1 cm grid so re-serialisation noise doesn't count as an edit
+        wkb = shapely.to_wkb(shapely.set_precision(geoms, 1e-7))
+        bounds = shapely.bounds(geoms)
+        frames.append(pd.DataFrame({
+            "layer": layer,
+            "id":    feature_ids(gdf).to_numpy(),
+            "hash":  [hashlib.blake2b(w, digest_size=8).hexdigest() for w in wkb],
+            "minx":  bounds[:, 0], "miny": bounds[:, 1],
+            "maxx":  bounds[:, 2], "maxy": bounds[:, 3],
+        }))
+    if not frames:
+        return pd.DataFrame(columns=["layer", "id", "hash", "minx", "miny", "maxx", "maxy"])
+    index = pd.concat(frames, ignore_index=True)
+    return index.dropna(subset=["id"]).drop_duplicates(["layer", "id"])
+
+
+# ---------------------------------------------------------------------------
+# TILE BUILD
+# ---------------------------------------------------------------------------
+
+class FeatureSet:
+    """Metric geometries + STRtrees for tile builds."""
+
+    def __init__(self, features: dict, corridor: dict = FLIGHT_CORRIDOR):
+        import shapely
+
+        self.features = {name: gdf for name, gdf in features.items() if not gdf.empty}
+        self.metric   = {name: gdf.to_crs(CRS_METRIC) for name, gdf in self.features.items()}
+        self.trees    = {name: shapely.STRtree(gdf.geometry.values) for name, gdf in self.metric.items()}
+        self.corridor = corridor
+        self.reach    = influence_m(corridor)
+
+    def near(self, layer: str, tile_m):
+        """Row positions of `layer` features whose zone can reach tile_m."""
+        if layer not in self.trees:
+            return []
+        return self.trees[layer].query(tile_m, predicate="dwithin", distance=self.reach[layer])
+
+
+def build_tile(fs: FeatureSet, i: int, j: int, tile_deg: float = TILE_DEG) -> gpd.GeoDataFrame:
+    """Zone pieces (+ exclusion-only safe area) for one tile, in CRS_WGS84."""
+    import geopandas as gpd
+    import shapely
+
+    from flight_paths import build_flight_zone
+
+    tile_m = gpd.GeoSeries([shapely.box(*tile_bounds(i, j, tile_deg))], crs=CRS_WGS84) \
+        .to_crs(CRS_METRIC).iloc[0]
+
+    layers, pieces = [], []
+    for zone_name, (feature_name, buffer_key) in ZONE_SOURCES.items():
+        hits = fs.near(feature_name, tile_m)
+        if len(hits) == 0:
+            continue
+        near  = fs.metric[feature_name].iloc[hits]
+        dist  = buffer_distances(near, buffer_key, fs.metric.get("runways"))
+        zone  = shapely.intersection(shapely.union_all(buffer_features(near, dist)), tile_m)
+        if not zone.is_empty:
+            layers.append(zone_name)
+            pieces.append(zone)
+
+    hits = fs.near("runways", tile_m)
+    if len(hits):
+        flight = build_flight_zone(fs.features["runways"].iloc[hits], fs.corridor)
+        if not flight.empty:
+            zone = shapely.intersection(flight.to_crs(CRS_METRIC).geometry.iloc[0], tile_m)
+            if not zone.is_empty:
+                layers.append("flight_zone")
+                pieces.append(zone)
+
+    safe = shapely.difference(tile_m, shapely.union_all(pieces)) if pieces else tile_m
+    if not safe.is_empty:
+        layers.append(SAFE_LAYER)
+        pieces.append(safe)
+
+    out = gpd.GeoDataFrame({"layer": layers}, geometry=pieces, crs=CRS_METRIC).to_crs(CRS_WGS84)
+    # reprojected tile edges wander a few mm off the tile lines and can self-intersect
+    out["geometry"] = shapely.intersection(shapely.make_valid(out.geometry.values),
+                                           shapely.box(*tile_bounds(i, j, tile_deg)))
+    return out[~out.geometry.is_empty]
+
+
+# ---------------------------------------------------------------------------
+# TILE CACHE
+# ---------------------------------------------------------------------------
+
+class TileCache:
+    """zone_tiles/ on disk: manifest, feature index, one parquet per tile."""
+
+    def __init__(self, root: Path = ZONE_TILES_DIR):
+        self.root = Path(root)
+        self.manifest_path = self.root / "manifest.json"
+        self.manifest = (
+            json.loads(self.manifest_path.read_text()) if self.manifest_path.exists() else None
+        )
+
+    @property
+    def tile_deg(self) -> float:
+        return self.manifest["tile_deg"]
+
+    @property
+    def corridor(self) -> dict:
+        return self.manifest["corridor"]
+
+    @property
+    def bbox(self) -> dict:
+        return self.manifest["bbox"]
+
+    def tiles(self) -> set[tuple[int, int]]:
+        return {parse_tile_key(k) for k in self.manifest["tiles"]}
+
+    def tile_path(self, i: int, j: int) -> Path:
+        return self.root / f"{tile_key(i, j)}.parquet"
+
+    def save_manifest(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifest_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(self.manifest, indent=2, sort_keys=True))
+        tmp.replace(self.manifest_path)
+
+    def start(self, snapshot: str, bbox: dict, corridor: dict, tile_deg: float = TILE_DEG,
+              mode: str = "bbox") -> None:
+        """Begin a fresh cache (old tiles and amenities are removed).
+
+        mode is "bbox" for zone_tiles.py builds, "statewide" for statewide.py.
+        """
+        if self.root.exists():
+            for old in self.root.glob("*.parquet"):
+                old.unlink()
+            (self.root / AMENITIES).unlink(missing_ok=True)
+        self.manifest = {
+            "snapshot": snapshot, "bbox": bbox, "corridor": corridor,
+            "tile_deg": tile_deg, "tiles": {}, "mode": mode,
+        }
+        self.save_manifest()
+
+    def write_tile(self, i: int, j: int, gdf: gpd.GeoDataFrame) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        gdf.to_parquet(self.tile_path(i, j))
+        self.manifest["tiles"][tile_key(i, j)] = {
+            "pieces": len(gdf),
+            "built":  datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+
+    def read_tile(self, i: int, j: int) -> gpd.GeoDataFrame:
+        import geopandas as gpd
+
+        return gpd.read_parquet(self.tile_path(i, j))
+
+    def write_feature_index(self, index: pd.DataFrame) -> None:
+        index.to_parquet(self.root / FEATURE_INDEX, index=False)
+
+    def read_feature_index(self) -> pd.DataFrame:
+        import pandas as pd
+
+        return pd.read_parquet(self.root / FEATURE_INDEX)
+
+    def refresh_amenities(self, pbf: Path, args) -> None:
+        """Amenities from the tiles' own PBF — or none, so no older snapshot's linger."""
+        from amenities import extract_amenities, save_amenities
+
+        path = self.root / AMENITIES
+        path.unlink(missing_ok=True)
+        rules = inclusion_rules(args)
+        if rules:
+            reach = inclusion_reach_m(rules)
+            save_amenities(extract_amenities(pbf, self.bbox, reach), path, reach)
+
+    def inclusions(self, args) -> dict:
+        """Inclusion zones from the cached amenities (none unless radii are given)."""
+        from amenities import amenities_reach_m, build_inclusion_zones, load_amenities
+
+        rules = inclusion_rules(args)
+        if not rules:
+            return {}
+        path = self.root / AMENITIES
+        if not path.exists() or inclusion_reach_m(rules) > amenities_reach_m(path):
+            print(f"  ERROR: no {path} for these radii — re-run `zone_tiles.py build` with them")
+            raise SystemExit(1)
+        return build_inclusion_zones(load_amenities(path), rules)
+
+    def rebuild(self, features: dict, tiles) -> int:
+        """(Re)build the given tiles from `features`; returns how many were written."""
+        fs = FeatureSet(features, self.corridor)
+        count = 0
+        for i, j in sorted(tiles):
+            self.write_tile(i, j, build_tile(fs, i, j, self.tile_deg))
+            count += 1
+        self.save_manifest()
+        return count
+
+
+def study_tiles(bbox: dict, tile_deg: float = TILE_DEG) -> list[tuple[int, int]]:
+    return tiles_for_bounds(bbox["west"], bbox["south"], bbox["east"], bbox["north"], tile_deg)
+
+
+# ---------------------------------------------------------------------------
+# WRITE  → safe_zones.gpkg  (per-tile pieces, patched in place)
+# ---------------------------------------------------------------------------
+
+def inclusion_hash(inclusions: dict) -> str:
+    """Fingerprint of the inclusion zones the safe pieces were clipped to."""
+    import shapely
+
+    digest = hashlib.blake2b(digest_size=8)
+    for name in sorted(inclusions):
+        digest.update(name.encode())
+        for wkb in shapely.to_wkb(inclusions[name].geometry.values):
+            digest.update(wkb)
+    return digest.hexdigest()
+
+
+def tile_pieces(cache: TileCache, i: int, j: int, inclusions: list) -> gpd.GeoDataFrame:
+    """One tile's pieces clipped to the study bbox; safe pieces also to every inclusion."""
+    import shapely
+
+    bbox = cache.bbox
+    w, s, e, n = tile_bounds(i, j, cache.tile_deg)
+    rect = shapely.box(max(w, bbox["west"]), max(s, bbox["south"]),
+                       min(e, bbox["east"]), min(n, bbox["north"]))
+
+    tile = cache.read_tile(i, j)
+    tile["geometry"] = shapely.intersection(tile.geometry.values, rect)
+    safe = (tile["layer"] == SAFE_LAYER).to_numpy()
+    for geom in inclusions:
+        clipped = shapely.intersection(geom, rect)
+        tile.loc[safe, "geometry"] = shapely.intersection(tile.geometry.values[safe], clipped)
+    tile[TILE_COLUMN] = tile_key(i, j)
+    return tile[~tile.geometry.is_empty]
+
+
+def tiled_gpkg(out: Path) -> bool:
+    """Whether `out` was written by write_zones() (an in-memory `zones` run isn't)."""
+    import pyogrio
+
+    if not out.exists():
+        return False
+    layers = {name for name, _ in pyogrio.list_layers(out)}
+    return SAFE_LAYER in layers and TILE_COLUMN in pyogrio.read_info(out, layer=SAFE_LAYER)["fields"]
+
+
+def delete_tile_rows(out: Path, keys: list[str]) -> None:
+    """Drop the given tiles' pieces from every tiled layer of the GeoPackage."""
+    import sqlite3
+
+    with sqlite3.connect(out) as db:
+        layers = [row[0] for row in db.execute("SELECT table_name FROM gpkg_contents")]
+        for layer in layers:
+            columns = {row[1] for row in db.execute(f'PRAGMA table_info("{layer}")')}
+            if TILE_COLUMN not in columns:
+                continue
+            db.execute(f'CREATE INDEX IF NOT EXISTS "{layer}_{TILE_COLUMN}" ON "{layer}" ({TILE_COLUMN})')
+            db.executemany(f'DELETE FROM "{layer}" WHERE {TILE_COLUMN} = ?', [(k,) for k in keys])
+
+
+def write_zones(cache: TileCache, inclusions: dict | None = None, tiles=None,
+                out: Path = OUTPUT_SAFE_SHP) -> None:
+    """Write tile pieces to the GeoPackage, WRITE_TILES at a time.
+
+    tiles=None rewrites every tile.  Otherwise only those tiles' rows are
+    replaced — unless the inclusion zones changed since the last write or `out`
+    isn't a tiled GeoPackage, in which case it falls back to a full rewrite.
+    Safe area is summed per tile in the manifest, so the report costs nothing.
+    """
+    import geopandas as gpd
+    import pandas as pd
+    import shapely
+    from pyogrio import write_dataframe
+
+    inclusions = inclusions or {}
+    signature  = inclusion_hash(inclusions)
+    if tiles is not None and (cache.manifest.get("inclusions") != signature or not tiled_gpkg(out)):
+        print("\n  Inclusion zones or GeoPackage changed — rewriting every tile")
+        tiles = None
+
+    if tiles is None:
+        tiles = sorted(cache.tiles())
+        print(f"\n  Writing {len(tiles)} tiles → {out}...")
+        out.unlink(missing_ok=True)
+        # the safe layer exists even if nothing is safe — readers expect it
+        empty = gpd.GeoDataFrame({TILE_COLUMN: pd.Series([], dtype="str")}, geometry=[], crs=CRS_WGS84)
+        write_dataframe(empty, out, layer=SAFE_LAYER, driver="GPKG", geometry_type="Unknown")
+        for name, gdf in inclusions.items():
+            if not gdf.empty:
+                write_dataframe(gdf, out, layer=name, driver="GPKG", append=True, geometry_type="Unknown")
+    else:
+        tiles = sorted(tiles)
+        print(f"\n  Patching {len(tiles)} tiles in {out}...")
+        delete_tile_rows(out, [tile_key(i, j) for i, j in tiles])
+
+    incl = [shapely.union_all(gdf.geometry.values) for gdf in inclusions.values() if not gdf.empty]
+    if len(incl) < len(inclusions):
+        incl = [shapely.Polygon()]            # an empty inclusion layer rules everything out
+
+    for start in range(0, len(tiles), WRITE_TILES):
+        chunk  = tiles[start:start + WRITE_TILES]
+        frames = [tile_pieces(cache, i, j, incl) for i, j in chunk]
+        pieces = gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), geometry="geometry", crs=CRS_WGS84)
+
+        for layer, group in pieces.groupby("layer"):
+            write_dataframe(group[[TILE_COLUMN, "geometry"]], out, layer=layer, driver="GPKG",
+                            append=out.exists(), geometry_type="Unknown")
+        safe = pieces[pieces["layer"] == SAFE_LAYER]
+        safe_m2 = safe.to_crs(CRS_METRIC).area.groupby(safe[TILE_COLUMN]).sum()
+        for i, j in chunk:
+            key = tile_key(i, j)
+            cache.manifest["tiles"][key]["safe_m2"] = float(safe_m2.get(key, 0.0))
+
+    cache.manifest["inclusions"] = signature
+    cache.save_manifest()
+
+    study_m2 = gpd.GeoSeries([bbox_polygon(cache.bbox)], crs=CRS_WGS84).to_crs(CRS_METRIC).area.iloc[0]
+    safe_m2  = sum(tile.get("safe_m2", 0.0) for tile in cache.manifest["tiles"].values())
+    print(f"\n  Study area  : {study_m2 / 1_000_000:.1f} km²")
+    print(f"  Safe area   : {safe_m2  / 1_000_000:.1f} km²")
+    print(f"  % livable   : {safe_m2 / study_m2 * 100 if study_m2 else 0:.1f}%")
+    print(f"  GeoPackage saved → {out.resolve()}")
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def cmd_build(args) -> None:
+    bbox = parse_bbox(args.bbox)
+    check_pbf(args.pbf)
+    t0 = time.perf_counter()
+
+    features = extract_features(args.pbf, bbox)
+    cache = TileCache(args.root)
+    cache.start(args.pbf.name, bbox, dict(FLIGHT_CORRIDOR), args.tile_deg)
+    tiles = study_tiles(bbox, args.tile_deg)
+    print(f"\n  Building {len(tiles)} tiles ({args.tile_deg}° each)...")
+    cache.rebuild(features, tiles)
+    cache.write_feature_index(feature_index(features))
+    cache.refresh_amenities(args.pbf, args)
+    print(f"  Tiles built in {time.perf_counter() - t0:.1f} s → {cache.root.resolve()}")
+
+    write_zones(cache, cache.inclusions(args))
+
+
+def cmd_merge(args) -> None:
+    cache = TileCache(args.root)
+    if cache.manifest is None:
+        print(f"  ERROR: no tile cache in {cache.root} — run `zone_tiles.py build` first")
+        raise SystemExit(1)
+    write_zones(cache, cache.inclusions(args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiled exclusion / safe zone cache")
+    parser.add_argument("--root", type=Path, default=ZONE_TILES_DIR, help="Tile cache directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("build", help="Extract the PBF and build every tile")
+    p.add_argument("--bbox", type=str, default=None, help='"south,north,west,east" — default is full SD County')
+    p.add_argument("--pbf", type=Path, default=PBF_FILE, help=f"OSM extract (default: {PBF_FILE})")
+    p.add_argument("--tile-deg", type=float, default=TILE_DEG, help=f"Tile size in degrees (default: {TILE_DEG})")
+    add_inclusion_args(p)
+    p.set_defaults(func=cmd_build)
+
+    p = sub.add_parser("merge", help="Rewrite safe_zones.gpkg from the cached tiles")
+    add_inclusion_args(p)
+    p.set_defaults(func=cmd_merge)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()